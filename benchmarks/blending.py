@@ -0,0 +1,75 @@
+'''
+Compare the fixed-point blend_over with the float64 blending which ImageProcessor used before.
+
+Usage (from the root of the repository):
+    python -m benchmarks.blending [--width W] [--height H] [--repeat N]
+
+Random BGRA images are blended. The error of both implementations is measured against
+the exact (float) result.
+'''
+import argparse
+import time
+import numpy as np
+from src.utils.blending import blend_over
+
+def blend_over_float(image_bottom:np.ndarray, image_top:np.ndarray) -> np.ndarray:
+    '''
+    The previous implementation: float64 alpha and a Python loop over the color channels
+    '''
+    bottom_alpha = image_bottom[:, :, 3] / 255.0
+    overlay_rgb = image_top[:, :, :3]
+    overlay_alpha = image_top[:, :, 3] / 255.0
+    image_result = np.zeros_like(image_bottom)
+    for c in range(3):
+        image_result[:, :, c] = (overlay_rgb[:, :, c] * overlay_alpha +
+                                 image_bottom[:, :, c] * (1 - overlay_alpha)).astype(np.uint8)
+    image_result[:, :, 3] = ((overlay_alpha + bottom_alpha * (1.0 - overlay_alpha)) * 255).astype(np.uint8)
+    return image_result
+
+def blend_over_exact(image_bottom:np.ndarray, image_top:np.ndarray) -> np.ndarray:
+    '''
+    The exact result without rounding
+    '''
+    alpha = image_top[:, :, 3:] / 255.0
+    color = image_top[:, :, :3] * alpha + image_bottom[:, :, :3] * (1 - alpha)
+    result_alpha = (alpha + image_bottom[:, :, 3:] / 255.0 * (1 - alpha)) * 255
+    return np.concatenate([color, result_alpha], axis=2)
+
+def measure(function, repeat:int) -> float:
+    '''
+    Get the fastest of `repeat` calls of function in milliseconds
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--repeat', type=int, default=10, help='number of blends per implementation')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.height, args.width, 4)
+    image_bottom = rng.integers(0, 256, shape, dtype=np.uint8)
+    image_top = rng.integers(0, 256, shape, dtype=np.uint8)
+    out = np.empty_like(image_bottom)
+    exact = blend_over_exact(image_bottom, image_top)
+
+    print(f'Blending {args.width}x{args.height} BGRA images')
+    print(f'{"implementation":<24} {"ms":>8} {"max error":>10}')
+    results = [
+        ('float64 (previous)', lambda: blend_over_float(image_bottom, image_top)),
+        ('blend_over', lambda: blend_over(image_bottom, image_top)),
+        ('blend_over(out=...)', lambda: blend_over(image_bottom, image_top, out=out)),
+    ]
+    for name, function in results:
+        error = np.abs(function() - exact).max()
+        print(f'{name:<24} {measure(function, args.repeat):8.1f} {error:10.2f}')
+
+if __name__ == '__main__':
+    main()
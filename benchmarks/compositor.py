@@ -0,0 +1,85 @@
+'''
+Compare compositing the tiles of the layers on the GUI thread with compositing them on the thread pool.
+
+Usage (from the root of the repository):
+    python -m benchmarks.compositor [--width W] [--height H] [--elements N] [--threads T] [--repeat R]
+
+A screenshot-sized base layer gets N random elements and a second layer gets N more. The benchmark
+times a full recomposite of the first layer (what render_layer_hard does after redrawing the elements)
+and a full export of both layers. The speed-up depends on the number of cores.
+Use QT_QPA_PLATFORM=offscreen to run without a display.
+'''
+import argparse
+import os
+import time
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from src.config import config
+from src.DrawableElement import DrawableElement
+from src.ZoomableWidget import ZoomableWidget
+from src.ImageProcessor import ImageProcessor
+from src.ImageProcessingToolSetting import ImageProcessingToolSetting
+import src.utils.parallel
+
+def add_random_elements(image_processor:ImageProcessor, num_elements:int, rng:np.random.Generator) -> None:
+    '''
+    Add elements of random size, position and rotation to the active layer
+    '''
+    height, width = image_processor.final_image.shape[:2]
+    for _ in range(num_elements):
+        size = rng.integers(50, 800, 2)
+        image = rng.integers(0, 256, (size[0], size[1], 4), dtype=np.uint8)
+        angle = rng.uniform(0, 2 * np.pi)
+        transformation = np.array([[np.cos(angle), -np.sin(angle), rng.integers(0, width)],
+                                   [np.sin(angle), np.cos(angle), rng.integers(0, height)]], dtype=np.float32)
+        image_processor.add_element(DrawableElement('PencilTool', image=image, transformation=transformation))
+
+def measure(function, repeat:int) -> float:
+    '''
+    Get the fastest of `repeat` calls of function in milliseconds
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def use_threads(num_threads:int) -> None:
+    '''
+    Set the number of compositor threads and create a new thread pool
+    '''
+    config['compositor']['threads'] = num_threads
+    src.utils.parallel._executor = None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--elements', type=int, default=50, help='number of elements per layer')
+    parser.add_argument('--threads', type=int, default=os.cpu_count(), help='threads of the parallel run')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    image_processor = ImageProcessor(ZoomableWidget(), ImageProcessingToolSetting())
+    rng = np.random.default_rng(0)
+    capture = rng.integers(0, 256, (args.height, args.width, 4), dtype=np.uint8)
+    capture[:, :, 3] = 255
+    image_processor.set_view(capture, (0, 0))
+    add_random_elements(image_processor, args.elements, rng)
+    image_processor.add_layer()
+    add_random_elements(image_processor, args.elements, rng)
+
+    print(f'{args.width}x{args.height}, {args.elements} elements per layer, {os.cpu_count()} cores')
+    print(f'{"threads":>8} {"recomposite layer ms":>22} {"export ms":>10}')
+    for num_threads in sorted({1, args.threads}):
+        use_threads(num_threads)
+        recomposite = measure(image_processor.layers[0].render_layer_soft, args.repeat)
+        def export():
+            image_processor.render_layers() # the combination of the layers is dirty
+            image_processor.export_image()
+        print(f'{num_threads:>8} {recomposite:22.1f} {measure(export, args.repeat):10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Compare the encode time and the size of the output of the registered encoders.
+
+Usage (from the root of the repository):
+    python -m benchmarks.encoders [image_path] [--repeat N]
+
+Without an image a synthetic screenshot-like image is used.
+'''
+import argparse
+import time
+import cv2
+import numpy as np
+from src.utils.image_encoders import ENCODERS, get_available_encoders, encode_image
+
+def make_synthetic_screenshot(width:int=1920, height:int=1080) -> np.ndarray:
+    '''
+    Create a BGRA image that looks roughly like a screenshot: flat areas, text-like noise and a gradient
+    '''
+    image = np.full((height, width, 4), 255, dtype=np.uint8)
+    image[:, :, 0] = np.linspace(180, 255, width, dtype=np.uint8) # gradient background
+    image[: height // 10, :, :3] = (60, 60, 60) # title bar
+    rng = np.random.default_rng(0)
+    for _ in range(400): # text-like lines
+        x, y = int(rng.integers(0, width - 300)), int(rng.integers(height // 10, height - 10))
+        cv2.putText(image, 'The quick brown fox', (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0, 255), 1)
+    return image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', nargs='?', help='image to encode (default: synthetic 1920x1080)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of encodes per encoder')
+    args = parser.parse_args()
+
+    if args.image:
+        image = cv2.imread(args.image, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise SystemExit(f'Could not read {args.image}')
+    else:
+        image = make_synthetic_screenshot()
+    raw_bytes = image.nbytes
+    print(f'Image {image.shape[1]}x{image.shape[0]}, {raw_bytes / 1e6:.1f} MB raw')
+    print(f'{"encoder":<12} {"ms":>9} {"bytes":>11} {"ratio":>7}')
+
+    available = get_available_encoders()
+    for name in ENCODERS:
+        if name not in available:
+            print(f'{name:<12} not available')
+            continue
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            data = encode_image(image, name)
+            times.append(time.perf_counter() - start)
+        print(f'{name:<12} {min(times) * 1000:9.1f} {len(data):11d} {raw_bytes / len(data):7.1f}')
+
+if __name__ == '__main__':
+    main()
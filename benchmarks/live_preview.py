@@ -0,0 +1,82 @@
+'''
+Measure the CPU time spent on the live preview while the selection is resized, with and without
+merging the selection changes with the FrameCoalescer.
+
+Usage (from the root of the repository):
+    python -m benchmarks.live_preview [--events N] [--interval MS]
+
+The selection grows by four pixels per mouse event, simulating a mouse which reports every `interval` ms.
+Use QT_QPA_PLATFORM=offscreen to run without a display.
+'''
+import argparse
+import sys
+import time
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+from src.config import config
+from src.utils.Box import Box
+from src.ZoomableWidget import ZoomableWidget
+from src.ImageProcessor import ImageProcessor
+from src.ImageProcessingToolSetting import ImageProcessingToolSetting
+from src.FrameCoalescer import FrameCoalescer
+
+def run(app:QApplication, coalesce:bool, num_events:int, interval:int) -> tuple:
+    '''
+    Simulate resizing the selection. Returns (CPU seconds, number of preview updates)
+    '''
+    zoomable_widget = ZoomableWidget()
+    image_processor = ImageProcessor(zoomable_widget, ImageProcessingToolSetting())
+    zoomable_widget.show() # include painting the preview
+    capture = np.full((2160, 3840, 4), 255, dtype=np.uint8)
+    state = {'event': 0, 'updates': 0}
+
+    def update_preview():
+        size = 400 + 4 * state['event']
+        selection = Box(100, 100, size, size)
+        image_processor.set_view(capture[selection.top : selection.top + selection.height,
+                                         selection.left : selection.left + selection.width],
+                                 (selection.left, selection.top))
+        state['updates'] += 1
+
+    coalescer = FrameCoalescer(config['live_preview']['fps'])
+    coalescer.triggered.connect(update_preview)
+    request = coalescer.request if coalesce else update_preview
+
+    # The mouse reports at a fixed rate. Events which arrive while the GUI is busy are queued
+    # and delivered one after another, like real input events.
+    timer = QTimer()
+    timer.setInterval(interval)
+    def on_mouse_events():
+        due = min(num_events, int((time.perf_counter() - start_wall) * 1000 / interval) + 1)
+        while state['event'] < due:
+            state['event'] += 1
+            request()
+        if state['event'] >= num_events:
+            timer.stop()
+            QTimer.singleShot(100, app.quit) # let the last merged update through
+    timer.timeout.connect(on_mouse_events)
+
+    start = time.process_time()
+    start_wall = time.perf_counter()
+    timer.start()
+    app.exec_()
+    return time.process_time() - start, state['updates']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=300, help='number of simulated mouse events')
+    parser.add_argument('--interval', type=int, default=2, help='milliseconds between mouse events')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    direct_time, direct_updates = run(app, False, args.events, args.interval)
+    merged_time, merged_updates = run(app, True, args.events, args.interval)
+    print(f'{args.events} selection changes, one every {args.interval} ms')
+    print(f'every change:  {direct_updates:4d} updates, {direct_time * 1000:8.1f} ms CPU')
+    print(f'per frame:     {merged_updates:4d} updates, {merged_time * 1000:8.1f} ms CPU')
+    if merged_time > 0:
+        print(f'CPU reduction: {direct_time / merged_time:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Time dragging an element with and without a transform session and check that both give the same layer.
+
+Usage (from the root of the repository):
+    python -m benchmarks.transform_session [--width W] [--height H] [--elements N] [--moves M]
+
+The lowest of N random translucent elements is moved M times. After every move the final image of
+the session is compared with render_layer_soft, which composites the layer again from scratch.
+The session blends the elements above the moved one as a single premultiplied image, so the 8 bit
+rounding happens in a different order and a few levels of difference are expected (as is 1 level
+where a rotated element is warped per tile). Exits with an error if the difference is larger than
+--tolerance, e.g. when image_above is not blended as premultiplied.
+Use QT_QPA_PLATFORM=offscreen to run without a display.
+'''
+import argparse
+import sys
+import time
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from src.ZoomableWidget import ZoomableWidget
+from src.ImageProcessor import ImageProcessor
+from src.ImageProcessingToolSetting import ImageProcessingToolSetting
+from benchmarks.compositor import add_random_elements
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--elements', type=int, default=30)
+    parser.add_argument('--moves', type=int, default=10)
+    parser.add_argument('--tolerance', type=int, default=3, help='largest allowed difference per channel')
+    args = parser.parse_args()
+
+    app = QApplication([])
+    image_processor = ImageProcessor(ZoomableWidget(), ImageProcessingToolSetting())
+    rng = np.random.default_rng(0)
+    capture = rng.integers(0, 256, (args.height, args.width, 4), dtype=np.uint8)
+    capture[:, :, 3] = 255
+    image_processor.set_view(capture, (0, 0))
+    add_random_elements(image_processor, args.elements, rng)
+    layer = image_processor.layers[0]
+    element = layer.elements[0] # every other element is above it
+
+    session_time = 0.0
+    full_time = 0.0
+    max_difference = 0
+    layer.begin_transform(element)
+    for _ in range(args.moves):
+        element.get_transformation()[:, 2] += rng.integers(-20, 21, 2)
+        start = time.perf_counter()
+        layer.update_transform()
+        session_time += time.perf_counter() - start
+        session_image = layer.final_image.copy()
+        start = time.perf_counter()
+        layer.render_layer_soft()
+        full_time += time.perf_counter() - start
+        max_difference = max(max_difference, int(np.abs(session_image.astype(int) - layer.final_image).max()))
+    layer.end_transform()
+
+    print(f'{args.width}x{args.height}, {args.elements} elements, {args.moves} moves')
+    print(f'transform session     {session_time / args.moves * 1000:8.2f} ms per move')
+    print(f'render_layer_soft     {full_time / args.moves * 1000:8.2f} ms per move')
+    print(f'max difference        {max_difference:8d}')
+    if max_difference > args.tolerance:
+        sys.exit('The transform session does not match render_layer_soft')
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,80 @@
-from src.ScreenshotApp import ScreenshotApp
-from PyQt5.QtWidgets import QApplication
+import time
+START_TIME = time.perf_counter() # the start of the startup profile
+
+import argparse
 import os
 import sys
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+def parse_args():
+    parser = argparse.ArgumentParser(description='Take and annotate screenshots')
+    parser.add_argument('--daemon', action='store_true',
+                        help='stay resident without a window and wait for capture commands')
+    parser.add_argument('--trigger', nargs='+', metavar='COMMAND',
+                        help='send a command to the resident process: region, full, monitor N or quit')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='print how long each phase of the startup takes')
+    return parser.parse_args()
+
+def trigger(command):
+    '''
+    Send a command to the resident process. Avoids importing Qt, cv2, etc. to return quickly
+    '''
+    from src.config import config
+    from src.utils.capture_client import get_socket_path, send_command
+    command = ' '.join(command) if command == ['quit'] else ' '.join(['capture'] + command)
+    try:
+        reply = send_command(command, get_socket_path(config['daemon']['socket_path']))
+    except OSError as e:
+        print(f'Could not reach the resident process (start it with --daemon): {e}')
+        return 1
+    if reply != 'ok':
+        print(reply)
+        return 1
+    return 0
 
 if __name__ == '__main__':
+    args = parse_args()
+    if args.trigger:
+        sys.exit(trigger(args.trigger))
+
+    from src.utils.startup_profile import startup_profile
+    if args.startup_profile:
+        startup_profile.enable(START_TIME)
+    startup_profile.mark('parse arguments')
+
+    from dotenv import load_dotenv
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    startup_profile.mark('import Qt')
+    from src.ScreenshotApp import ScreenshotApp
+    startup_profile.mark('import ScreenshotApp')
+
+    # Load environment variables from .env file
+    load_dotenv()
+
     Qapp = QApplication(sys.argv)
-    app = ScreenshotApp()
-    app.show()
+    startup_profile.mark('create QApplication')
+    app = ScreenshotApp(resident=args.daemon)
+    Qapp.aboutToQuit.connect(app.shutdown)
+    if args.daemon:
+        from src.CaptureServer import CaptureServer
+        # Keep running when the windows are closed
+        Qapp.setQuitOnLastWindowClosed(False)
+        server = CaptureServer(app)
+        try:
+            server.listen()
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        Qapp.aboutToQuit.connect(server.close)
+    else:
+        app.show()
+    startup_profile.mark('show')
+    if args.startup_profile:
+        def report_startup():
+            # Called once the event loop has processed the events queued during the startup
+            startup_profile.mark('first event loop iteration')
+            from src.config import config
+            print(startup_profile.report(config['startup']['budget_ms']))
+        QTimer.singleShot(0, report_startup)
     sys.exit(Qapp.exec_())
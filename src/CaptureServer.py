@@ -0,0 +1,81 @@
+from PyQt5.QtCore import QObject
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+from PyQt5.QtWidgets import QApplication
+from src.config import config
+from src.utils.capture_client import get_socket_path
+
+class CaptureServer(QObject):
+    '''
+    Listen on a local (Unix domain) socket for commands of the capture client and run them in the
+    resident ScreenshotApp. One command per line, answered with "ok" or "error <message>":
+        capture region - capture the monitor under the cursor and select a region of it
+        capture full - capture all monitors
+        capture monitor <n> - capture monitor n (1 is the first monitor)
+        quit - exit the resident process
+    '''
+    def __init__(self, screenshot_app, socket_path:str=None):
+        super().__init__()
+        self.screenshot_app = screenshot_app
+        self.socket_path = get_socket_path(config['daemon']['socket_path']) if socket_path is None else socket_path
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.on_new_connection)
+
+    def listen(self) -> None:
+        '''
+        Start listening. A socket file left behind by a previous process is removed, but a socket on which
+        another resident process still answers is not taken over
+        '''
+        if is_server_running(self.socket_path):
+            raise RuntimeError(f'Another resident process is already listening on {self.socket_path}')
+        QLocalServer.removeServer(self.socket_path)
+        if not self.server.listen(self.socket_path):
+            raise RuntimeError(f'Could not listen on {self.socket_path}: {self.server.errorString()}')
+
+    def close(self) -> None:
+        self.server.close()
+
+    def on_new_connection(self) -> None:
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self.on_ready_read(socket))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def on_ready_read(self, socket:QLocalSocket) -> None:
+        while socket.canReadLine():
+            command = bytes(socket.readLine()).decode().strip()
+            try:
+                self.run_command(command)
+                reply = 'ok'
+            except Exception as e:
+                reply = f'error {e}'
+            socket.write(f'{reply}\n'.encode())
+            socket.flush()
+
+    def run_command(self, command:str) -> None:
+        '''
+        Run a command received from the capture client
+
+        Parameters:
+            command: the command e.g. "capture monitor 2"
+        '''
+        words = command.split()
+        if words == ['capture', 'region']:
+            self.screenshot_app.capture_region('cursor')
+        elif words == ['capture', 'full']:
+            self.screenshot_app.capture_full()
+        elif len(words) == 3 and words[:2] == ['capture', 'monitor'] and words[2].isdigit():
+            self.screenshot_app.capture_monitor(int(words[2]))
+        elif words == ['quit']:
+            QApplication.quit()
+        else:
+            raise ValueError(f'Unknown command: {command}')
+
+def is_server_running(socket_path:str, timeout_ms:int=1000) -> bool:
+    '''
+    Check if a server accepts connections on a local socket
+    '''
+    socket = QLocalSocket()
+    socket.connectToServer(socket_path)
+    running = socket.waitForConnected(timeout_ms)
+    socket.abort()
+    return running
@@ -0,0 +1,188 @@
+import time
+import collections
+import numpy as np
+from typing import Deque, Dict, List, Optional, Tuple
+from mss import mss
+from src.utils.Box import Box, box_contains, box_intersects
+from src.config import config
+
+class Capture:
+    '''
+    A grabbed BGRA image together with the area of the virtual desktop which it covers.
+    Selections are kept relative to the capture (i.e. they are indices into self.image) and
+    converted to desktop coordinates only when needed.
+    '''
+    def __init__(self, image:np.ndarray, box:Box):
+        self.image = image # BGRA image with shape (box.height, box.width, 4)
+        self.box = box # the area of the virtual desktop in desktop coordinates
+
+    def contains(self, box:Box) -> bool:
+        '''
+        Check if a box in desktop coordinates is fully inside the capture
+        '''
+        return box_contains(self.box, box)
+
+    def to_desktop(self, box:Box) -> Box:
+        '''
+        Convert a box relative to the capture to desktop coordinates
+        '''
+        return Box(box.left + self.box.left, box.top + self.box.top, box.width, box.height)
+
+    def from_desktop(self, box:Box) -> Box:
+        '''
+        Convert a box in desktop coordinates to coordinates relative to the capture
+        '''
+        return Box(box.left - self.box.left, box.top - self.box.top, box.width, box.height)
+
+    def crop(self, box:Box) -> np.ndarray:
+        '''
+        Get the part of the image inside a box relative to the capture. No pixels are copied.
+        '''
+        return self.image[box.top : box.top + box.height, box.left : box.left + box.width]
+
+class CaptureService:
+    '''
+    Long-lived owner of a single mss session. All screen grabs go through this object so the
+    connection to the display server is set up only once.
+    Every grab returns a BGRA image (the native format of mss) and records how long it took.
+    '''
+    def __init__(self):
+        self.sct = mss()
+        self.last_grab_time:float = None # the duration of the last grab in seconds
+        self.grab_times:Deque[Tuple[str, float]] = collections.deque(maxlen=config['capture']['timing_history'])
+
+    @property
+    def desktop(self) -> Box:
+        '''
+        The bounding box of all monitors in desktop coordinates
+        '''
+        return monitor_to_box(self.sct.monitors[0])
+
+    @property
+    def monitors(self) -> List[Box]:
+        '''
+        The boxes of the physical monitors. The monitor with index n in mss is monitors[n - 1]
+        '''
+        return [monitor_to_box(monitor) for monitor in self.sct.monitors[1:]]
+
+    def get_monitor_at(self, x:int, y:int) -> int:
+        '''
+        Get the mss index of the monitor containing the point (x, y). Fall back to the first monitor.
+        '''
+        for i, monitor in enumerate(self.monitors):
+            if box_contains(monitor, Box(x, y, 1, 1)):
+                return i + 1
+        return 1
+
+    def get_monitor_box(self, n:int) -> Box:
+        '''
+        Get the box of a monitor in desktop coordinates
+
+        Parameters:
+            n: the index of the monitor as in mss. 0 is the whole virtual desktop, 1 is the first monitor
+        '''
+        if not 0 <= n < len(self.sct.monitors):
+            raise ValueError(f'There is no monitor with index {n}')
+        return monitor_to_box(self.sct.monitors[n])
+
+    def capture_monitor(self, n:int) -> Capture:
+        '''
+        Grab a single monitor (or the whole desktop for n=0) as a Capture
+        '''
+        return Capture(self.grab_monitor(n), self.get_monitor_box(n))
+
+    def capture_box(self, box:Box, previous:Optional[Capture]=None) -> Capture:
+        '''
+        Capture the monitors which the box touches. Only these monitors are grabbed, the result
+        covers their bounding box (not the whole desktop).
+
+        Parameters:
+            box: a box in desktop coordinates
+            previous: a capture whose pixels are reused for the monitors it already contains.
+                This avoids grabbing again (and capturing our own windows) on monitors already captured.
+        Returns:
+            Capture: covering the bounding box of the touched monitors. Areas of that bounding box
+                which are not on any monitor are transparent black.
+        '''
+        touched = [monitor for monitor in self.monitors if box_intersects(monitor, box)]
+        if not touched:
+            raise ValueError(f'The box {box} is not on any monitor')
+        if len(touched) == 1 and (previous is None or not previous.contains(touched[0])):
+            # A single monitor can be grabbed directly without stitching
+            return Capture(self.grab_region(touched[0]), touched[0])
+
+        # Stitch the touched monitors into their bounding box
+        left = min(monitor.left for monitor in touched)
+        top = min(monitor.top for monitor in touched)
+        right = max(monitor.left + monitor.width for monitor in touched)
+        bottom = max(monitor.top + monitor.height for monitor in touched)
+        capture = Capture(np.zeros((bottom - top, right - left, 4), dtype=np.uint8),
+                          Box(left, top, right - left, bottom - top))
+        for monitor in touched:
+            if previous is not None and previous.contains(monitor):
+                image = previous.crop(previous.from_desktop(monitor))
+            else:
+                image = self.grab_region(monitor)
+            capture.crop(capture.from_desktop(monitor))[:] = image
+        return capture
+
+    def grab_full(self) -> np.ndarray:
+        '''
+        Grab the whole virtual desktop (all monitors)
+        '''
+        return self.grab(self.sct.monitors[0], 'grab_full')
+
+    def grab_monitor(self, n:int) -> np.ndarray:
+        '''
+        Grab a single monitor
+
+        Parameters:
+            n: the index of the monitor as in mss. 0 is the whole virtual desktop, 1 is the first monitor
+        '''
+        if not 0 <= n < len(self.sct.monitors):
+            raise ValueError(f'There is no monitor with index {n}')
+        return self.grab(self.sct.monitors[n], f'grab_monitor({n})')
+
+    def grab_region(self, box:Box) -> np.ndarray:
+        '''
+        Grab a region of the screen
+
+        Parameters:
+            box: the left, top, width, height of the region in screen coordinates
+        '''
+        region = {'left': box.left, 'top': box.top, 'width': box.width, 'height': box.height}
+        return self.grab(region, 'grab_region')
+
+    def grab(self, region:Dict[str, int], name:str='grab') -> np.ndarray:
+        '''
+        Grab a region of the screen and record the time it took
+
+        Parameters:
+            region: dictionary with left, top, width, height as used by mss
+            name: the name under which the timing is reported
+        Returns:
+            np.ndarray: opaque BGRA image with shape (height, width, 4)
+        '''
+        start = time.perf_counter()
+        screenshot = self.sct.grab(region)
+        image = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+        # The alpha byte of mss may or may not be valid. The screen is opaque
+        image = image.copy()
+        image[:, :, 3] = 255
+        self.last_grab_time = time.perf_counter() - start
+        self.grab_times.append((name, self.last_grab_time))
+        if config['capture']['report_timing']:
+            print(f'{name}: {screenshot.width}x{screenshot.height} in {self.last_grab_time * 1000:.1f} ms')
+        return image
+
+    def close(self) -> None:
+        '''
+        Close the mss session
+        '''
+        self.sct.close()
+
+def monitor_to_box(monitor:Dict[str, int]) -> Box:
+    '''
+    Convert a monitor dictionary from mss to a Box
+    '''
+    return Box(monitor['left'], monitor['top'], monitor['width'], monitor['height'])
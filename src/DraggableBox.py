@@ -18,6 +18,12 @@ class zone_areas(IntEnum):
     bottom_left = auto()
     bottom_right = auto()
 
+def get_default_selection(width:int, height:int) -> Box:
+    '''
+    Get the selection shown before the user selects anything: a small box in the middle of an area
+    '''
+    return Box(width // 2 - 50, height // 2 - 50, 100, 100)
+
 class DraggableBox(QFrame):
 
     # Sginal that sends changes to the screenshot selection (moving/resizing). Signals to ScreenshotApp
@@ -36,10 +42,8 @@ class DraggableBox(QFrame):
         self.border = config['draggable_box']['border']
         self.resize_border = config['draggable_box']['resize_border']
         if selection is None:
-            self.selection = Box(int(config['monitor']['width']) // 2 - 50,
-                             int(config['monitor']['height']) // 2 - 50,
-                             100,
-                             100)
+            # Start in the middle of the parent (the TransparentWindow)
+            self.selection = get_default_selection(parent.width(), parent.height())
         else:
             self.selection = selection
         self.initGUI()
@@ -1,6 +1,19 @@
 import numpy as np
-import cv2
-from typing import Tuple
+from functools import lru_cache
+from typing import Optional, Tuple
+from src.utils.Box import Box
+
+@lru_cache(maxsize=64)
+def get_distance_kernel(r:int) -> np.ndarray:
+    '''
+    Get the squared distance of every pixel of a (2r+1)x(2r+1) square from its center.
+    Pixels with a value <= r**2 form a disc. The kernel must not be modified.
+    The radius depends on the scale of the element, so only the recently used kernels are kept
+    '''
+    offsets = np.arange(-r, r + 1)
+    kernel = offsets[:, np.newaxis]**2 + offsets[np.newaxis, :]**2
+    kernel.flags.writeable = False
+    return kernel
 
 class DrawableElement():
     def __init__(self,
@@ -9,25 +22,55 @@ class DrawableElement():
                  image:np.ndarray=None,
                  size:Tuple[int,int]=None,
                  touch_mask:np.ndarray=None,
-                 transformation:np.ndarray=None):
+                 transformation:np.ndarray=None,
+                 offset:Tuple[int,int]=(0, 0)):
         self.id = None # Unique id for the drawable element
         self.tool = tool_name # The tool which has created the drawable element
         self.z_index = None # The z-index of the element
         self.visible = None # bool
         self.instructions = instructions # The instructions used by the Tool to draw the element
         self.transformation = transformation # A linear transformation to apply when overlaying the element
+        self.inverse_transformation = None # cached inverse of the transformation
+        self.inverse_source = None # the transformation from which the cached inverse was computed
         self.image = image # Image with the drawn element
         self.touch_mask = touch_mask # cv2 image with 1 channel with the same size as self.image
+        if size is None and image is not None:
+            size = image.shape[:2]
         self.size = size # The size of the image. Tuple[int, int] (h,w)
-        self.offset = (0, 0) # The offset to apply before adding self.image to the layer's image
+        # The position of the top left corner of self.image in the coordinates of the instructions.
+        # self.image only covers the drawn content, the transformation places it on the layer
+        self.offset = offset
+
+    def clear_image(self, size:Tuple[int, int]=None):
+        '''
+        Replace the image and the touch mask with empty ones
 
-    def clear_image(self):
+        Parameters:
+            size: the new (h, w) of the image e.g. the extents of the content to draw. By default self.size
+        '''
+        if size is not None:
+            self.size = size
         if self.size is None:
             raise ValueError("Image size is not set. Set `self.size` before calling `clear_image`.")
         height, width = self.size
         self.image = np.zeros((height, width, 4), dtype=np.uint8)
         self.touch_mask = np.zeros((height, width), dtype=np.uint8)
 
+    def set_offset(self, offset:Tuple[int, int]) -> None:
+        '''
+        Move the top left corner of self.image to another position in the coordinates of the instructions
+        e.g. after the element was drawn again at the extents of its content. The transformation is
+        changed so that the element stays at the same place on the layer.
+
+        Parameters:
+            offset: the new (x, y) position of the top left corner of self.image
+        '''
+        shift = np.array([offset[0] - self.offset[0], offset[1] - self.offset[1]], dtype=np.float32)
+        transformation = self.get_transformation().copy()
+        transformation[:, 2] += transformation[:, :2] @ shift
+        self.transformation = transformation
+        self.offset = offset
+
     def is_touched(self, x:int, y:int, r:int) -> bool:
         '''
         Check if a given coordinate is on top of the drawable element
@@ -39,37 +82,57 @@ class DrawableElement():
         Returns:
             bool: True if the element is touched, False otherwise
         '''
+        return self.get_touch_distance(x, y, r) is not None
+
+    def get_touch_distance(self, x:int, y:int, r:int) -> Optional[float]:
+        '''
+        Get the distance from a given coordinate to the nearest pixel of the touch mask within a radius.
+        All pixels in the radius are checked at once with a disc kernel.
+
+        Parameters:
+            x - the x coordinate
+            y - the y coordinate
+            r - the radius around (x, y) in the pixels of the layer
+        Returns:
+            float: the distance in the pixels of the layer or None if no pixel of the element is in the radius
+        '''
         # Cannot check for a touch if the element has no touchmask
         if self.touch_mask is None:
-            return False
+            return None
 
         # Get the inverse transformation matrix
         inverse_transformation = self.get_inverse_transformation()
 
         # Transform global coordinates (x, y) to local coordinates within the touch_mask
         local_coords = inverse_transformation @ np.array([x, y, 1])
-        local_x, local_y = int(local_coords[0]), int(local_coords[1])
-
-        # Check bounds to prevent out-of-range access
-        if (local_x < 0 or local_y < 0 or
-            local_x >= self.touch_mask.shape[1] or
-            local_y >= self.touch_mask.shape[0]):
-            return False
+        local_x, local_y = int(np.floor(local_coords[0])), int(np.floor(local_coords[1]))
+        # The radius in the pixels of the element (the scale of the transformation)
+        scale = np.sqrt(abs(np.linalg.det(self.get_transformation()[:, :2])))
+        local_r = int(np.ceil(r / scale)) if scale > 0 else 0
 
         # Define the bounding box for the radius around (local_x, local_y)
-        x_min = max(local_x - r, 0)
-        x_max = min(local_x + r, self.touch_mask.shape[1] - 1)
-        y_min = max(local_y - r, 0)
-        y_max = min(local_y + r, self.touch_mask.shape[0] - 1)
-
-        # Check the area within the radius for any pixel with a value of 255
-        for i in range(y_min, y_max + 1):
-            for j in range(x_min, x_max + 1):
-                # Check if (i, j) is within radius `r` from (local_x, local_y)
-                if (i - local_y)**2 + (j - local_x)**2 <= r**2:
-                    if self.touch_mask[i, j] == 255:
-                        return True # Touched area found
-        return False
+        height, width = self.touch_mask.shape[:2]
+        x_min = max(local_x - local_r, 0)
+        x_max = min(local_x + local_r, width - 1)
+        y_min = max(local_y - local_r, 0)
+        y_max = min(local_y + local_r, height - 1)
+        if x_min > x_max or y_min > y_max:
+            return None # the radius is outside of the touch mask
+
+        if local_r <= max(height, width):
+            # The part of the disc kernel which overlaps the touch mask
+            distances = get_distance_kernel(local_r)[y_min - local_y + local_r : y_max - local_y + local_r + 1,
+                                                     x_min - local_x + local_r : x_max - local_x + local_r + 1]
+        else:
+            # The kernel would be larger than the touch mask (a strongly shrunk element). Only compute
+            # the distances of the part of the touch mask inside the radius
+            distances = ((np.arange(y_min, y_max + 1) - local_y)[:, np.newaxis]**2 +
+                         (np.arange(x_min, x_max + 1) - local_x)[np.newaxis, :]**2)
+        touched = self.touch_mask[y_min : y_max + 1, x_min : x_max + 1] == 255
+        touched &= distances <= local_r**2
+        if not touched.any():
+            return None
+        return float(np.sqrt(distances[touched].min()) * scale)
 
     def get_transformation(self) -> np.ndarray:
         '''
@@ -84,12 +147,28 @@ class DrawableElement():
             ], dtype=np.float32)
         return self.transformation
 
+    def get_bounding_box(self) -> Box:
+        '''
+        Get the box which contains self.image after the transformation, in the coordinates of the layer.
+        Pixels outside the box are not changed when the element is overlaid.
+        '''
+        height, width = self.image.shape[:2]
+        # The corners of the image enlarged by one pixel which can still affect the interpolation
+        corners = np.array([[-1, -1, 1], [width, -1, 1], [-1, height, 1], [width, height, 1]], dtype=np.float64)
+        points = corners @ self.get_transformation().T
+        left, top = np.floor(points.min(axis=0)).astype(int)
+        right, bottom = np.ceil(points.max(axis=0)).astype(int) + 1
+        return Box(int(left), int(top), int(right - left), int(bottom - top))
+
     def get_inverse_transformation(self) -> np.ndarray:
         '''
-        Get the inverse of the transformation of the DrawableElement
+        Get the inverse of the transformation of the DrawableElement.
+        It is computed again only when the transformation changed (also if it was modified in place).
         '''
         transformation = self.get_transformation()
-        inverse_transformation_matrix = np.linalg.inv(transformation[:, :2])
-        inverse_translation = -inverse_transformation_matrix @ transformation[:, 2]
-        inverse_transformation = np.hstack([inverse_transformation_matrix, inverse_translation.reshape(-1, 1)])
-        return inverse_transformation
+        if self.inverse_source is None or not np.array_equal(self.inverse_source, transformation):
+            inverse_transformation_matrix = np.linalg.inv(transformation[:, :2])
+            inverse_translation = -inverse_transformation_matrix @ transformation[:, 2]
+            self.inverse_transformation = np.hstack([inverse_transformation_matrix, inverse_translation.reshape(-1, 1)])
+            self.inverse_source = transformation.copy()
+        return self.inverse_transformation
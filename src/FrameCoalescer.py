@@ -0,0 +1,68 @@
+import time
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+class FrameCoalescer(QObject):
+    '''
+    Collapse bursts of update requests into at most one update per frame.
+    The first request of a burst is delivered immediately, the requests that arrive during the
+    following frame are merged and delivered once when the frame is over.
+    '''
+
+    # Signal to do the (expensive) update
+    triggered = pyqtSignal()
+
+    def __init__(self, fps:float, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(max(1, int(1000 / fps)))
+        self.timer.timeout.connect(self.on_frame_end)
+        self.pending = False # is there a request which has not been delivered yet
+
+        # Statistics
+        self.num_requests = 0 # number of requests
+        self.num_updates = 0 # number of times triggered was emitted
+        self.cpu_time = 0.0 # process time spent in the update in seconds
+
+    def request(self) -> None:
+        '''
+        Request an update. Deliver it now if no update was delivered in the current frame
+        '''
+        self.num_requests += 1
+        if self.timer.isActive():
+            self.pending = True
+        else:
+            self.deliver()
+
+    def cancel(self) -> None:
+        '''
+        Drop a pending request e.g. because the update was done by other means
+        '''
+        self.pending = False
+
+    def on_frame_end(self) -> None:
+        '''
+        Deliver the requests merged during the frame
+        '''
+        if self.pending:
+            self.deliver()
+
+    def deliver(self) -> None:
+        self.pending = False
+        self.timer.start() # no other update until the end of the frame
+        start = time.process_time()
+        self.triggered.emit()
+        self.cpu_time += time.process_time() - start
+        self.num_updates += 1
+
+    def get_stats(self) -> str:
+        '''
+        Get a summary of how many requests were merged and the time spent in the updates
+        '''
+        return (f'{self.num_requests} requests -> {self.num_updates} updates, '
+                f'{self.cpu_time * 1000:.1f} ms CPU in updates')
+
+    def reset_stats(self) -> None:
+        self.num_requests = 0
+        self.num_updates = 0
+        self.cpu_time = 0.0
@@ -0,0 +1,30 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+class IdleDetector(QObject):
+    '''
+    Track whether the user is interacting (zooming, panning, dragging an element).
+    While interacting the views are drawn with the cheapest filtering. When no input arrived for
+    delay_ms the interaction is over and idle is emitted once so a high quality pass can be done.
+    '''
+
+    # Signal that the input has been idle for delay_ms after an interaction
+    idle = pyqtSignal()
+
+    def __init__(self, delay_ms:int, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.on_timeout)
+        self.interacting = False
+
+    def poke(self) -> None:
+        '''
+        Record input which is part of an interaction. Restart the delay
+        '''
+        self.interacting = True
+        self.timer.start()
+
+    def on_timeout(self) -> None:
+        self.interacting = False
+        self.idle.emit()
@@ -66,7 +66,8 @@ class ImageProcessingTool:
                                 instructions:dict={},
                                 image:np.ndarray=None,
                                 touch_mask:np.ndarray=None,
-                                transformation:np.ndarray=None):
+                                transformation:np.ndarray=None,
+                                offset:tuple=(0, 0)):
         '''
         Add a DrawableElement to the active layer
 
@@ -75,15 +76,17 @@ class ImageProcessingTool:
                 can use to draw the drawable element
             image: image for the drawable element. If it is not provided it will be drawn by the tool
             touch_mask: a black and white image that defines where an element can be touched
+            transformation: the affine transformation which places the image on the layer
+            offset: the (x, y) position of the top left corner of the image in the coordinates of the
+                instructions e.g. where it was cropped from
         '''
-        img_height = self.image_processor.zoomable_label.img_height
-        img_width = self.image_processor.zoomable_label.img_width
+        # The image only covers the content of the element. Its size is set when it is drawn
         drawable_element = DrawableElement(self.__class__.__name__,
                                            instructions,
                                            image=image,
-                                           size=(img_height, img_width),
                                            touch_mask=touch_mask,
-                                           transformation=transformation)
+                                           transformation=transformation,
+                                           offset=offset)
         self.image_processor.add_element(drawable_element)
         return drawable_element
 
@@ -6,9 +6,9 @@ from PyQt5.QtSvg import QSvgRenderer
 import cv2
 import numpy as np
 from functools import partial
-import copy
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from src.DrawableElement import DrawableElement
+from src.utils.Box import Box, box_intersection, box_union
 from src.utils.image_rendering import create_svg_icon
 
 class PencilTool(ImageProcessingTool):
@@ -16,12 +16,14 @@ class PencilTool(ImageProcessingTool):
         super().__init__(image_processor)
         self.points = [] # store the last 4 points
         self.all_points = [] # store all the points
-        self.pencil_color = self.config['options']['pencil_color']
+        self.pencil_color = self.config['options']['pencil_color'] # RGB. The images are BGRA
         self.pencil_thickness = self.config['options']['pencil_thickness']
         self.pencil_opacity = self.config['options']['pencil_opacity'] # in range 0-1
         self.pencil_alpha = self.pencil_opacity * 255
+        self.spline_sample_distance = self.config['options']['spline_sample_distance'] # pixels between spline samples
 
         self.grayscale_mask = None # a cv2 image with 1 channel. 255 => we have drawn here, 0 => we have not drawn here
+        self.stroke_box:Box = None # the area of the canvas which the current stroke touched
 
     def create_ui(self):
         """Create the button for the pencil tool."""
@@ -58,6 +60,7 @@ class PencilTool(ImageProcessingTool):
             y - the y-coordinate in the image
         '''
         self.all_points = [(x, y)]
+        self.stroke_box = None
         # Create a new mask
         self.grayscale_mask = np.zeros(self.image_processor.fake_layer.final_image.shape[:2], dtype=np.uint8)
         # Draw a white dot
@@ -66,14 +69,7 @@ class PencilTool(ImageProcessingTool):
                    radius = 0,
                    color=255, # white - a mask will be applied to change it
                    thickness=self.pencil_thickness)
-        # Change white areas to the specified color with opacity
-        for c in range(3): # Loop over the RGB channels
-            self.image_processor.fake_layer.final_image[:, :, c] = np.where(self.grayscale_mask == 255,
-                                                    self.pencil_color[c],
-                                                    self.image_processor.fake_layer.final_image[:, :, c])
-        self.image_processor.fake_layer.final_image[self.grayscale_mask == 255, 3] = self.pencil_alpha
-        # Update the zoomable label
-        self.image_processor.update_zoomable_label()
+        self.update_preview(self.get_stroke_box([(x, y)]))
 
     def on_mouse_move(self, x: int, y: int):
         '''
@@ -89,12 +85,12 @@ class PencilTool(ImageProcessingTool):
             # Calculate the spline points
             spline_points = self.catmull_rom_spline(*self.all_points[-4:])
             # Draw lines between the interpolated points
-            for i in range(len(spline_points) - 1):
-                cv2.line(self.grayscale_mask,
-                         spline_points[i],
-                         spline_points[i + 1],
-                         color=255, # white - a mask will be applied to change it
-                         thickness=self.pencil_thickness)
+            cv2.polylines(self.grayscale_mask,
+                          [spline_points],
+                          isClosed=False,
+                          color=255, # white - a mask will be applied to change it
+                          thickness=self.pencil_thickness)
+            self.update_preview(self.get_stroke_box(spline_points))
         elif len(self.all_points) == 2:
             # Draw a line between the first 2 points
             cv2.line(self.grayscale_mask,
@@ -102,15 +98,7 @@ class PencilTool(ImageProcessingTool):
                      self.all_points[1],
                      color=255,
                      thickness=self.pencil_thickness)
-        # Update the zoomable label
-        if len(self.all_points) != 3:
-            # Change white areas to the specified color with opacity
-            for c in range(3): # Loop over the RGB channels
-                self.image_processor.fake_layer.final_image[:, :, c] = np.where(self.grayscale_mask == 255,
-                                                        self.pencil_color[c],
-                                                        self.image_processor.fake_layer.final_image[:, :, c])
-            self.image_processor.fake_layer.final_image[self.grayscale_mask == 255, 3] = self.pencil_alpha
-            self.image_processor.update_zoomable_label()
+            self.update_preview(self.get_stroke_box(self.all_points))
 
     def on_mouse_up(self, x: int, y: int):
         '''
@@ -120,72 +108,138 @@ class PencilTool(ImageProcessingTool):
             x - the x-coordinate in the image
             y - the y-coordinate in the image
         '''
-        if len(self.all_points) > 0:
+        if len(self.all_points) > 0 and self.stroke_box is not None:
             instructions = {
                 'points': self.all_points,
                 'color': self.pencil_color,
                 'thickness': self.pencil_thickness,
                 'alpha': self.pencil_alpha
             }
-            drawable_element_image = copy.deepcopy(self.image_processor.fake_layer.final_image)
-            # Cut the non empty part of the image
-            non_zero_rows = np.any(self.grayscale_mask != 0, axis=1)
-            non_zero_columns = np.any(self.grayscale_mask != 0, axis=0)
-            min_y = np.argmax(non_zero_rows)
-            max_y = len(non_zero_rows) - np.argmax(non_zero_rows[::-1])
-            min_x = np.argmax(non_zero_columns)
-            max_x = len(non_zero_columns) - np.argmax(non_zero_columns[::-1])
-            cropped_image = drawable_element_image[min_y:max_y, min_x:max_x]
-            self.grayscale_mask = self.grayscale_mask[min_y:max_y, min_x:max_x]
-            transformation = np.array([[1, 0, min_x], [0, 1, min_y]], dtype=np.float32) # The affine transformation with offset
-            # Clear the fake layer
-            self.image_processor.fake_layer.clear_final_image()
-            # Create the new drawable element
-            self.create_drawable_element(instructions,
-                                         cropped_image,
-                                         touch_mask=self.grayscale_mask,
-                                         transformation=transformation)
+            # Cut the non empty part of the image. Only the area touched by the stroke is searched
+            box = self.stroke_box
+            mask = self.grayscale_mask[box.top : box.top + box.height, box.left : box.left + box.width]
+            non_zero_rows = np.any(mask != 0, axis=1)
+            non_zero_columns = np.any(mask != 0, axis=0)
+            if non_zero_rows.any():
+                min_y = box.top + np.argmax(non_zero_rows)
+                max_y = box.top + len(non_zero_rows) - np.argmax(non_zero_rows[::-1])
+                min_x = box.left + np.argmax(non_zero_columns)
+                max_x = box.left + len(non_zero_columns) - np.argmax(non_zero_columns[::-1])
+                cropped_image = self.image_processor.fake_layer.final_image[min_y:max_y, min_x:max_x].copy()
+                self.grayscale_mask = self.grayscale_mask[min_y:max_y, min_x:max_x].copy()
+                transformation = np.array([[1, 0, min_x], [0, 1, min_y]], dtype=np.float32) # The affine transformation with offset
+                # Clear the fake layer
+                self.image_processor.fake_layer.clear_final_image(box)
+                # Create the new drawable element
+                self.create_drawable_element(instructions,
+                                             cropped_image,
+                                             touch_mask=self.grayscale_mask,
+                                             transformation=transformation,
+                                             offset=(int(min_x), int(min_y)))
         # Clear points to end the current line
         self.all_points = []
+        self.stroke_box = None
+
+    def get_stroke_box(self, points:List[Tuple[int, int]]) -> Optional[Box]:
+        '''
+        Get the area of the canvas which lines through points drawn with the pencil thickness can touch
+
+        Parameters:
+            points - the (x, y) points
+        Returns:
+            Box: the area or None if it is outside of the canvas
+        '''
+        points = np.array(points)
+        left, top = points.min(axis=0) - self.pencil_thickness
+        right, bottom = points.max(axis=0) + self.pencil_thickness + 1
+        height, width = self.grayscale_mask.shape
+        return box_intersection(Box(int(left), int(top), int(right - left), int(bottom - top)), Box(0, 0, width, height))
+
+    def update_preview(self, box:Optional[Box]) -> None:
+        '''
+        Color the part of the fake layer where the mask was drawn inside box and show only that area
+
+        Parameters:
+            box - the area which was drawn e.g. the bounding box of the last segment
+        '''
+        if box is None:
+            return
+        self.stroke_box = box if self.stroke_box is None else box_union(self.stroke_box, box)
+        area = (slice(box.top, box.top + box.height), slice(box.left, box.left + box.width))
+        # Change white areas to the specified color with opacity
+        drawn = self.grayscale_mask[area] == 255
+        self.image_processor.fake_layer.final_image[area][drawn] = (*self.pencil_color[::-1], self.pencil_alpha)
+        # Update the zoomable label
+        self.image_processor.update_zoomable_label(box)
 
-    def catmull_rom_spline(self, p0, p1, p2, p3, num_points=100):
+    def catmull_rom_spline(self, p0, p1, p2, p3, num_points=None) -> np.ndarray:
         """
-        Calculate Catmull-Rom spline points.
+        Calculate Catmull-Rom spline points between p1 and p2.
 
         Parameters:
             p0, p1, p2, p3 - Tuples (x, y) for the control points
-            num_points - Number of points to generate along the spline
+            num_points - Number of points to generate along the spline. By default it depends on its length
         Returns:
-            List of interpolated points along the Catmull-Rom spline
+            np.ndarray: the interpolated (x, y) points along the Catmull-Rom spline with dtype int32
         """
-        p0, p1, p2, p3 = np.array(p0), np.array(p1), np.array(p2), np.array(p3)
-        interpolated_points = []
-        # Calculate each interpolated point
-        for i in range(num_points + 1):
-            t = i / num_points # Parameter t ranges from 0 to 1
-            # Catmull-Rom spline formula
-            point = 0.5 * ((2 * p1) +
-                           (-p0 + p2) * t +
-                           (2*p0 - 5*p1 + 4*p2 - p3) * t**2 +
-                           (-p0 + 3*p1 - 3*p2 + p3) * t**3)
-            interpolated_points.append((int(point[0]), int(point[1])))
-        return interpolated_points
+        return self.catmull_rom_splines([p0, p1, p2, p3], num_points)
+
+    def catmull_rom_splines(self, points, num_points=None) -> np.ndarray:
+        """
+        Calculate the points of the Catmull-Rom spline through a list of points, from the 2nd to the
+        2nd to last point. All segments are evaluated at once.
+
+        Parameters:
+            points - (x, y) control points. There must be at least 4
+            num_points - Number of points to generate along every segment. By default every segment gets
+                enough points to be at most spline_sample_distance pixels apart
+        Returns:
+            np.ndarray: the interpolated (x, y) points of all segments, one after the other, with dtype int32
+        """
+        points = np.asarray(points, dtype=np.float64)
+        p0, p1, p2, p3 = points[:-3], points[1:-2], points[2:-1], points[3:]
+        if num_points is None:
+            # The segment is a Bezier curve with control points p1, p1 + (p2 - p0) / 6, p2 - (p3 - p1) / 6, p2.
+            # The length of the control polygon is an upper bound of the length of the segment
+            c1 = p1 + (p2 - p0) / 6
+            c2 = p2 - (p3 - p1) / 6
+            length = (np.linalg.norm(c1 - p1, axis=1) + np.linalg.norm(c2 - c1, axis=1) +
+                      np.linalg.norm(p2 - c2, axis=1))
+            counts = np.clip(np.ceil(length / self.spline_sample_distance), 1, 100).astype(int)
+        else:
+            counts = np.full(len(p1), num_points)
+        # The segment of every point and its parameter t ranging from 0 to 1 within the segment
+        segment = np.repeat(np.arange(len(counts)), counts + 1)
+        starts = np.cumsum(counts + 1) - (counts + 1)
+        t = ((np.arange(len(segment)) - starts[segment]) / counts[segment])[:, np.newaxis]
+        # Catmull-Rom spline formula
+        a, b = 2 * p1, -p0 + p2
+        c, d = 2*p0 - 5*p1 + 4*p2 - p3, -p0 + 3*p1 - 3*p2 + p3
+        spline_points = 0.5 * (a[segment] + b[segment] * t + c[segment] * t**2 + d[segment] * t**3)
+        return spline_points.astype(np.int32)
 
     def draw_drawable_element(self, drawable_element:DrawableElement) -> None:
         '''
         Draw the drawable from the instructions.
         Update drawable_element.image using drawable_element.instructions.
+        The image only covers the extents of the stroke. Its offset is folded into the transformation.
         Note: The pencil first draws white on a cleared image. Then the white areas are 
         made non transparent and with the right color
         '''
-        # Clear the image before drawing
-        drawable_element.clear_image()
-
         # Get the instructions for drawing the DrawableElement
-        points = drawable_element.instructions['points']
+        points = np.array(drawable_element.instructions['points'], dtype=np.int32).reshape(-1, 2)
         color = drawable_element.instructions['color']
         thickness = drawable_element.instructions['thickness']
-        alpha_value = drawable_element.instructions['alpha'] * 255
+        alpha_value = drawable_element.instructions['alpha'] # in range 0-255
+        if len(points) == 0:
+            return
+
+        # Clear the image before drawing. It is only as big as the area the stroke can touch
+        left, top = points.min(axis=0) - thickness
+        right, bottom = points.max(axis=0) + thickness + 1
+        drawable_element.clear_image((int(bottom - top), int(right - left)))
+        drawable_element.set_offset((int(left), int(top)))
+        points = [tuple(point) for point in (points - (left, top)).tolist()] # relative to the image
 
         # Draw the first point
         if len(points) >= 1:
@@ -201,26 +255,18 @@ class PencilTool(ImageProcessingTool):
                      points[1],
                      color=(255, 255, 255),
                      thickness=thickness)
-        # Draw the rest of the interpolated points/lines
-        for i in range(1, len(points) - 3):
-            # draw the between points i and i+1
-            spline_points = self.catmull_rom_spline(*points[i-1: i+3]) # calculate the spline points
-            # Draw lines between the interpolated points
-            for j in range(len(spline_points) - 1):
-                cv2.line(drawable_element.image,
-                         spline_points[j],
-                         spline_points[j + 1],
-                         color=(255, 255, 255),
-                         thickness=thickness)
+        # Draw the rest of the interpolated points/lines with one polyline
+        if len(points) >= 4:
+            cv2.polylines(drawable_element.image,
+                          [self.catmull_rom_splines(points)],
+                          isClosed=False,
+                          color=(255, 255, 255),
+                          thickness=thickness)
         # Create a mask for the white areas
         mask = cv2.inRange(drawable_element.image[:, :, :3], (255, 255, 255), (255, 255, 255))
-        # Change white areas to the specified color with opacity
-        for c in range(3): # Loop over the RGB channels
-            drawable_element.image[:, :, c] = np.where(mask == 255,
-                                                    color[c],
-                                                    drawable_element.image[:, :, c])
-        # Set the alpha channel for the white areas to the desired opacity
-        drawable_element.image[mask == 255, 3] = alpha_value
+        # Change white areas to the specified color with opacity (the color is RGB)
+        drawable_element.image[mask == 255] = (color[2], color[1], color[0], alpha_value)
+        drawable_element.touch_mask = mask
 
     def create_settings_ui(self):
         settings_widget = QWidget()
@@ -2,7 +2,6 @@ from src.ImageProcessingTools.ImageProcessingTool import ImageProcessingTool
 from PyQt5.QtWidgets import QPushButton, QWidget
 from PyQt5.QtCore import QSize
 from functools import partial
-import cv2
 import numpy as np
 from enum import IntEnum, auto
 from src.DrawableElement import DrawableElement
@@ -61,8 +60,9 @@ class SelectTool(ImageProcessingTool):
         # Check if there's a previously created rotatable_box and delete it if it exists
         self.delete_rotatable_boxes()
 
-        # Get the drawable element beneath the mouse down event if such an element exists
-        self.selected_element = self.image_processor.get_touch_element(x, y, 0)
+        # Get the drawable element beneath the mouse down event if such an element exists.
+        # Thin strokes are hard to hit exactly so the nearest element within the pick radius is selected
+        self.selected_element = self.image_processor.get_nearest_element(x, y, self.config['options']['pick_radius'])
         if self.selected_element is None:
             return
 
@@ -359,10 +359,8 @@ class TextTool(ImageProcessingTool):
         '''
         Draw the drawable from the instructions.
         Update drawable element.image using drawable_element.instructions.
+        The image has the size of the rendered text widget.
         '''
-        # Clear the image before drawing
-        drawable_element.clear_image()
-
         # Create a temporary text widget
         temp_widget = QTextEdit()
         instructions = drawable_element.instructions
@@ -384,6 +382,7 @@ class TextTool(ImageProcessingTool):
         cv_image = qpixmap_to_cv2(pixmap)
 
         drawable_element.image = cv_image
+        drawable_element.size = cv_image.shape[:2]
         drawable_element.touch_mask = np.ones(cv_image.shape[:2]) * 255
 
     def resize_text_widget(self, text_widget):
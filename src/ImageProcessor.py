@@ -1,24 +1,36 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton
-from PyQt5.QtCore import pyqtSignal, QTimer
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton
+from PyQt5.QtCore import QSize, pyqtSignal
+from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import Qt
-import cv2
 import numpy as np
 from enum import IntEnum, auto
 import importlib
-import copy
-from typing import List
-from scipy.interpolate import CubicSpline
-from src.ZoomableLabel import ZoomableLabel
+from typing import List, Optional, Tuple
 from src.ZoomableWidget import ZoomableWidget
 from src.Layer import Layer, FakeLayer
 from src.DrawableElement import DrawableElement
 from src.config import config
+from src.utils.blending import blend_over, unpremultiply
+from src.utils.Box import Box, box_intersection, box_union
+from src.utils.TileGrid import TileGrid
+from src.utils.parallel import map_tiles
 
 from src.ImageProcessingToolSetting import ImageProcessingToolSetting
 # Import ImageProcessingTools
 from src.ImageProcessingTools.ImageProcessingTool import ImageProcessingTool
-from src.ImageProcessingTools.PencilTool import PencilTool
+
+_cv2 = None # cv2 once it is imported
+
+def get_cv2():
+    '''
+    Get the cv2 module. It is imported on first use to keep it off the startup path, and the import
+    machinery is not involved again on the hot paths (e.g. blending every element into every tile)
+    '''
+    global _cv2
+    if _cv2 is None:
+        import cv2
+        _cv2 = cv2
+    return _cv2
 
 class ImageProcessor(QWidget):
 
@@ -27,6 +39,9 @@ class ImageProcessor(QWidget):
         move = 0
         pencil = auto()
 
+    # Signal that layers were added, removed or their visibility changed
+    layers_changed = pyqtSignal()
+
     def __init__(self,
                  zoomable_widget:ZoomableWidget,
                  image_processing_tool_setting:ImageProcessingToolSetting):
@@ -38,9 +53,17 @@ class ImageProcessor(QWidget):
         self.layers:List[Layer] = [] # All the layers
         self.fake_layer:FakeLayer = None # layer for visualising stuff not part of what is drawn
         self.active_layer_index = 0 # the index of the active layer
-        self.final_image = None # The final image after adding all the layers together
+        self.final_image = None # The final image after adding all the visible layers together. Premultiplied
+        self.final_tiles:TileGrid = None # the dirty tiles of final_image if it combines several layers
+        self.stack_state = None # the visible layers and their generations which final_image was made from
+        self.preview_image = None # Buffer for the final image with the fake layer on top
+        self.view_origin = None # (x, y) position of the shown image on the screen
 
         self.image_processing_tool_setting = image_processing_tool_setting
+        # Let the ZoomableLabel composite the dirty tiles it is about to show
+        self.zoomable_label.compositor = self
+        # Blend a dragged element with high quality once the input is idle
+        self.zoomable_label.idle_detector.idle.connect(self.refine_element_transformation)
 
         self.initUI()
 
@@ -53,20 +76,36 @@ class ImageProcessor(QWidget):
         self.load_tools_from_config()
 
         for tool_name in sorted(self.tool_classes.keys(), key=lambda k: self.tool_classes[k]['order']):
-            tool_obj = self.tool_classes[tool_name]['object']
-            tool_widget = tool_obj.create_ui()
+            # The tool itself is created when its button is first clicked
+            tool_widget = self.create_tool_placeholder(tool_name)
+            self.tool_classes[tool_name]['widget'] = tool_widget
             layout.addWidget(tool_widget)
 
         self.setLayout(layout)
 
-    def update_zoomable_label(self):
+    def update_zoomable_label(self, box:Box=None):
         '''
         Update the image shown in the zoomable label
+
+        Parameters:
+            box: the area of the fake layer which changed e.g. the last segment drawn by a tool.
+                By default everything is blended again
         '''
         if self.fake_layer.visible:
             # If the fake layer is visible draw it on top
-            final_image = self.overlay_images(self.final_image, self.fake_layer.final_image)
-            self.zoomable_label.update_transformed_image(final_image)
+            shown = self.zoomable_label.transformed_image
+            if box is not None and shown is self.preview_image and shown.shape == self.final_image.shape:
+                # Only the area which changed is blended again and shown
+                self.composite_area(box)
+                area = (slice(box.top, box.top + box.height), slice(box.left, box.left + box.width))
+                blend_over(self.final_image[area], self.fake_layer.final_image[area], out=self.preview_image[area])
+                self.zoomable_label.update_transformed_image(self.preview_image, box)
+                return
+            self.composite_area()
+            if self.preview_image is None or self.preview_image.shape != self.final_image.shape:
+                self.preview_image = np.empty_like(self.final_image)
+            blend_over(self.final_image, self.fake_layer.final_image, out=self.preview_image)
+            self.zoomable_label.update_transformed_image(self.preview_image)
         else:
             # If the fake layer is not visible display just the final image
             self.zoomable_label.update_transformed_image(self.final_image)
@@ -76,17 +115,54 @@ class ImageProcessor(QWidget):
     ################
 
     def load_tools_from_config(self):
+        '''
+        Register the tools from the config.json file. The tool modules are imported and
+        the tools are created only when they are first used (see get_tool)
+        '''
         for tool in config['tools']:
             tool_name = tool["name"]
-            module = importlib.import_module(f'src.ImageProcessingTools.{tool_name}')
-            tool_class = getattr(module, tool_name)
-            tool_obj = tool_class(self)
             self.tool_classes[tool_name] = {
-                'class': tool_class,
-                'object': tool_obj,
+                'class': None,
+                'object': None,
+                'widget': None, # the button of the tool (a placeholder until the tool is created)
                 'order': tool['order'],
             }
 
+    def get_tool(self, tool_name:str) -> ImageProcessingTool:
+        '''
+        Get the tool object. The tool is created the first time it is needed.
+        '''
+        tool = self.tool_classes[tool_name]
+        if tool['object'] is None:
+            module = importlib.import_module(f'src.ImageProcessingTools.{tool_name}')
+            tool['class'] = getattr(module, tool_name)
+            tool['object'] = tool['class'](self)
+        return tool['object']
+
+    def create_tool_placeholder(self, tool_name:str) -> QPushButton:
+        '''
+        Create a button which looks like the button of the tool without creating the tool.
+        The icon is rendered only when the button is painted.
+        '''
+        button = QPushButton()
+        button.setIcon(QIcon(f'resources/tools/{tool_name}/tool_button.svg'))
+        button.setIconSize(QSize(36, 36))
+        button.setFixedSize(QSize(36, 36))
+        button.clicked.connect(lambda: self.on_tool_placeholder_clicked(tool_name))
+        return button
+
+    def on_tool_placeholder_clicked(self, tool_name:str) -> None:
+        '''
+        Create the tool, replace the placeholder with the UI of the tool and select the tool
+        '''
+        tool_obj = self.get_tool(tool_name)
+        placeholder = self.tool_classes[tool_name]['widget']
+        tool_widget = tool_obj.create_ui()
+        self.layout().replaceWidget(placeholder, tool_widget)
+        placeholder.deleteLater()
+        self.tool_classes[tool_name]['widget'] = tool_widget
+        tool_obj.set_tool()
+
     def set_tool(self, tool: ImageProcessingTool):
         # Disable the previous tool
         if self.current_tool is not None:
@@ -112,6 +188,8 @@ class ImageProcessor(QWidget):
             x - the x coordinate of the event on the image
             y - the y coordinate of the event on the image
         '''
+        if not self.layers:
+            return # there is no document to draw on
         self.current_tool.on_mouse_move(x, y)
 
     def on_mouse_down(self, x:int, y:int):
@@ -122,6 +200,8 @@ class ImageProcessor(QWidget):
             x - the x coordinate of the event on the image
             y - the y coordinate of the event on the image
         '''
+        if not self.layers:
+            return # there is no document to draw on
         self.current_tool.on_mouse_down(x, y)
 
     def on_mouse_up(self, x:int, y:int):
@@ -132,18 +212,22 @@ class ImageProcessor(QWidget):
             x - the x coordinate of the event on the image
             y - the y coordinate of the event on the image
         '''
+        if not self.layers:
+            return # there is no document to draw on
         self.current_tool.on_mouse_up(x, y)
 
     def on_new_image(self):
         '''
-        Handle signals from the ZoomableLable about a new image
+        Start a new document with the image shown in the ZoomableLabel as its first layer.
+        Called by set_view when there are no layers
         '''
         self.layers = [] # clear the previous layers
-        image = copy.deepcopy(self.zoomable_label.original_image)
+        # The image is BGRA and is not modified. The layer draws on its own copy of it
+        image = self.zoomable_label.original_image
         # Add an alpha channel in case there isn't already one
         if image.shape[2] == 3:
-            alpha_channel = np.full((image.shape[0], image.shape[1], 1), 255, dtype=np.uint8)
-            image = np.concatenate((image, alpha_channel), axis=2)
+            cv2 = get_cv2()
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
         # Add a layer with the image and set the active layer index
         self.layers.append(Layer(self, image))
         self.active_layer_index = 0
@@ -151,21 +235,77 @@ class ImageProcessor(QWidget):
         empty_image = np.zeros((image.shape[0], image.shape[1], 4), dtype=np.uint8)
         self.fake_layer = FakeLayer(self, image=empty_image)
         # Initialise the final image
-        self.final_image = copy.deepcopy(image)
+        self.final_image = self.layers[0].final_image
+        self.final_tiles = None
+        self.stack_state = None
+        self.layers_changed.emit()
+
+    def set_view(self, image:np.ndarray, origin:Tuple[int, int]) -> None:
+        '''
+        Show a part of the screenshot e.g. after the screenshot selection changes. The layers and their
+        elements are kept at the same position on the screen. If the size of the view does not change
+        the buffers of the layers are reused and the zoom of the ZoomableLabel is kept.
+
+        Parameters:
+            image: BGRA view of the screenshot. It is not modified
+            origin: the (x, y) position of the view on the screen
+        '''
+        same_size = self.final_image is not None and self.final_image.shape == image.shape
+        self.zoomable_label.setImage(image, keep_view=same_size)
+        if not self.layers:
+            # Start a new document
+            self.on_new_image()
+        else:
+            # Move the elements so that they stay at the same position on the screen
+            translation = (self.view_origin[0] - origin[0], self.view_origin[1] - origin[1])
+            self.layers[0].set_image(image, translation)
+            for layer in self.layers[1:]:
+                layer_image = layer.image if layer.image.shape == image.shape else np.zeros_like(image)
+                layer.set_image(layer_image, translation)
+            if not same_size:
+                self.fake_layer = FakeLayer(self, image=np.zeros_like(image))
+        self.view_origin = origin
+        self.render_layers()
+
+    def clear(self) -> None:
+        '''
+        Remove all layers and elements e.g. before editing a new screenshot
+        '''
+        self.layers = []
+        self.fake_layer = None
+        self.final_image = None
+        self.final_tiles = None
+        self.stack_state = None
+        self.view_origin = None
+        self.layers_changed.emit()
 
     #################
     # Layer methods #
     #################
 
-    def add_layer(self, image=None):
-        layer = Layer(image=image)
-        self.layers.append(layer)
+    def add_layer(self, image:np.ndarray=None) -> None:
+        '''
+        Add a layer on top of the other layers and make it the active layer
+
+        Parameters:
+            image: the starting image of the layer. By default a transparent image
+        '''
+        if not self.layers:
+            return # there is no image to draw on
+        if image is None:
+            image = np.zeros_like(self.layers[0].image)
+        self.layers.append(Layer(self, image))
         self.active_layer_index = len(self.layers) - 1
+        self.render_layers()
+        self.layers_changed.emit()
 
     def remove_layer(self, index):
-        if 0 <= index < len(self.layers):
+        # Keep at least one layer
+        if 0 <= index < len(self.layers) and len(self.layers) > 1:
             del self.layers[index]
             self.active_layer_index = min(self.active_layer_index, len(self.layers) - 1)
+            self.render_layers()
+            self.layers_changed.emit()
 
     def set_active_layer(self, index):
         if 0 <= index < len(self.layers):
@@ -174,19 +314,104 @@ class ImageProcessor(QWidget):
     def toggle_layer_visibility(self, index):
         if 0 <= index < len(self.layers):
             self.layers[index].toggle_visibility()
+            # Only the cached images of the layers are combined again
+            self.render_layers()
+            self.layers_changed.emit()
+
+    def get_visible_layers(self) -> List[Layer]:
+        return [layer for layer in self.layers if layer.visible]
+
+    def render_layers(self, box:Box=None):
+        '''
+        Show the visible layers. With a single visible layer its final image is shown directly.
+        Otherwise the layers are combined in tiles. The dirty tiles of the layers and of the combination
+        are composited when the ZoomableLabel paints them.
 
-    def render_layers(self):
+        Parameters:
+            box: the area of the final image which changed. By default the whole image
         '''
-        Render all layers
+        self.update_stack(box)
+        self.zoomable_label.update_transformed_image(self.final_image, box)
+
+    def update_stack(self, box:Box=None) -> None:
         '''
-        self.final_image = None
-        for layer in self.layers:
-            if self.final_image is None:
-                self.final_image = layer.final_image
+        Set self.final_image for the visible layers and mark the area which has to be combined again.
+
+        Parameters:
+            box: the area which changed in one of the layers. By default everything changed unless
+                no layer changed (according to the generations of the layers)
+        '''
+        visible_layers = self.get_visible_layers()
+        stack_state = [(id(layer), layer.generation) for layer in visible_layers]
+        if len(visible_layers) == 1:
+            # Nothing to combine
+            self.final_image = visible_layers[0].final_image
+            self.final_tiles = None
+            self.stack_state = stack_state
+            return
+        height, width = self.layers[0].final_image.shape[:2]
+        if self.final_tiles is None or (self.final_tiles.width, self.final_tiles.height) != (width, height):
+            # The final image needs its own buffer
+            self.final_image = np.zeros((height, width, 4), dtype=np.uint8)
+            self.final_tiles = TileGrid(width, height, config['compositor']['tile_size'])
+        elif box is None and stack_state == self.stack_state:
+            return # nothing changed
+        elif [key for key, _ in stack_state] != [key for key, _ in (self.stack_state or [])]:
+            box = None # other layers are visible
+        self.final_tiles.mark_dirty(box)
+        self.stack_state = stack_state
+
+    def combine_layers(self, box:Box) -> None:
+        '''
+        Combine the cached final images of the visible layers inside a box into self.final_image
+        '''
+        area = (slice(box.top, box.top + box.height), slice(box.left, box.left + box.width))
+        visible_layers = self.get_visible_layers()
+        if not visible_layers:
+            self.final_image[area] = 0
+            return
+        np.copyto(self.final_image[area], visible_layers[0].final_image[area])
+        for layer in visible_layers[1:]:
+            blend_over(self.final_image[area], layer.final_image[area], out=self.final_image[area],
+                       premultiplied_top=True)
+
+    def composite_area(self, box:Box=None) -> Optional[Box]:
+        '''
+        Composite the dirty tiles of the visible layers inside an area and combine them
+
+        Parameters:
+            box: the area. By default the whole image
+        Returns:
+            Box: the area which was composited or None if nothing was dirty
+        '''
+        changed = None
+        for layer in self.get_visible_layers():
+            layer_changed = layer.composite(box)
+            if layer_changed is None:
                 continue
-            self.final_image = self.overlay_images(self.final_image, layer.final_image)
+            changed = layer_changed if changed is None else box_union(changed, layer_changed)
+            if self.final_tiles is not None:
+                self.final_tiles.mark_dirty(layer_changed)
+        if self.final_tiles is not None:
+            tiles = self.final_tiles.take_dirty_tiles(box)
+            map_tiles(self.combine_layers, tiles)
+            for tile in tiles:
+                changed = tile if changed is None else box_union(changed, tile)
+        return changed
+
+    def export_image(self) -> np.ndarray:
+        '''
+        Composite the visible layers once at full resolution. This is what the editor shows
+        without the fake layer.
 
-        self.zoomable_label.update_transformed_image(self.final_image)
+        Returns:
+            cv2 image with 4 channels (not premultiplied) or None if there is no image
+        '''
+        if not self.layers:
+            return None
+        self.update_stack()
+        self.composite_area()
+        return unpremultiply(self.final_image.copy())
 
     def render_layer(self, index:int) -> None:
         '''
@@ -201,27 +426,6 @@ class ImageProcessor(QWidget):
             self.render_element(drawable_element, redraw=False)
             # add element to layer
 
-    def overlay_images(self, image_bottom:np.ndarray, image_top:np.ndarray) -> np.ndarray:
-        '''
-        Overlay two images and return the result
-
-        Parameters:
-            image_bottom: the image on the bottom. cv2 image with 4 channels
-            image_top: the image on the top. cv2 image with 4 channels
-        Returns:
-            cv2 image with 4 channels. The result of placing image_top on top of image_bottom
-        '''
-        bottom_alpha = image_bottom[:, :, 3] / 255.0
-        overlay_rgb = image_top[:, :, :3]
-        overlay_alpha = image_top[:, :, 3] / 255.0
-        image_result = np.zeros_like(image_bottom)
-        for c in range(3): # Loop over the RGB channels
-            image_result[:, :, c] = (overlay_rgb[:, :, c] * overlay_alpha +
-                                   image_bottom[:, :, c] * (1 - overlay_alpha)).astype(np.uint8)
-        # Compute the final alpha channel
-        image_result[:, :, 3] = ((overlay_alpha + bottom_alpha * (1.0 - overlay_alpha)) * 255).astype(np.uint8)
-        return image_result
-
     ###################
     # Element methods #
     ###################
@@ -231,16 +435,47 @@ class ImageProcessor(QWidget):
             # Do not redraw if the image is already drawn
             return
         tool_name = drawable_element.tool
-        tool_obj = self.tool_classes[tool_name]['object']
+        tool_obj = self.get_tool(tool_name)
         tool_obj.draw_drawable_element(drawable_element)
 
     def add_element(self, drawable_element:DrawableElement):
         # Add the element to the current layer
-        self.layers[self.active_layer_index].add_element(drawable_element)
+        layer = self.layers[self.active_layer_index]
+        layer.add_element(drawable_element)
         # Add the layers together to get the final image
-        self.final_image = self.layers[self.active_layer_index].final_image # TODO implement multiple layers logic
+        self.update_stack(layer.element_boxes[drawable_element] or Box(0, 0, 0, 0))
         self.update_zoomable_label()
 
+    def begin_element_transformation(self, drawable_element:DrawableElement) -> None:
+        '''
+        Start moving, rotating or resizing a drawable_element e.g. when a drag starts.
+        Until end_element_transformation is called apply_element_transformation only blends the element again.
+
+        Parameters:
+            drawable_element: the drawable_element. It must be in the elements list of the currently
+                active layer.
+        '''
+        self.layers[self.active_layer_index].begin_transform(drawable_element)
+
+    def end_element_transformation(self) -> None:
+        '''
+        Finish the transformation started with begin_element_transformation
+        '''
+        self.refine_element_transformation()
+        self.layers[self.active_layer_index].end_transform()
+
+    def refine_element_transformation(self) -> None:
+        '''
+        Blend the element of the transform session with high quality if it was last blended with
+        fast interpolation (see apply_element_transformation)
+        '''
+        layer = self.layers[self.active_layer_index] if self.layers else None
+        if layer is None or layer.transform_session is None or not layer.transform_session.fast:
+            return
+        box = layer.update_transform()
+        if box is not None:
+            self.render_layers(box)
+
     def apply_element_transformation(self, drawable_element:DrawableElement) -> None:
         '''
         This function applies the transformation of a drawable_element and redraws the layer which contains it
@@ -249,12 +484,26 @@ class ImageProcessor(QWidget):
             drawable_element: the drawable_element. It must be in the elements list of the currently
                 active layer.
         '''
-        # Update the active layer
-        self.layers[self.active_layer_index].rerender_after_element_update(drawable_element)
+        layer = self.layers[self.active_layer_index]
+        session = layer.transform_session
+        if session is not None and session.element is drawable_element:
+            # Only blend the element between the cached composites below and above it.
+            # It is blended with high quality once the input is idle (see on_idle)
+            box = layer.update_transform(fast=True)
+            self.zoomable_label.idle_detector.poke()
+        else:
+            # Update the active layer
+            box = layer.rerender_after_element_update(drawable_element)
+        if box is None:
+            return
         # Update the final image
-        self.render_layers()
+        self.render_layers(box)
 
-    def overlay_element_on_image(self, image:np.ndarray, drawable_element:DrawableElement) -> None:
+    def overlay_element_on_image(self,
+                                 image:np.ndarray,
+                                 drawable_element:DrawableElement,
+                                 box:Box=None,
+                                 fast:bool=False) -> None:
         '''
         Modify an image by overlaying a drawable_element on top of it. Take into account opacity
 
@@ -262,22 +511,31 @@ class ImageProcessor(QWidget):
             image: an opencv image
             drawable_element: A drawable element that has already been rendered.
                 If the drawable element has an affine transformation it will be applied when overlayig it
+            box: only change the image inside this box e.g. a tile. By default the whole image
+            fast: use nearest neighbour instead of bilinear interpolation for the transformation
         '''
-        # Get the transformation
-        transformation = drawable_element.get_transformation()
+        cv2 = get_cv2()
+        # Only the part of the image under the transformed element is warped and blended
+        box = box_intersection(drawable_element.get_bounding_box(),
+                               Box(0, 0, image.shape[1], image.shape[0]) if box is None else box)
+        if box is None:
+            return
+        # Get the transformation relative to the top left corner of the box
+        transformation = drawable_element.get_transformation().copy()
+        transformation[:, 2] -= (box.left, box.top)
         # Apply the affine transformation
         transformed_element_img = cv2.warpAffine(drawable_element.image,
                                                  transformation,
-                                                 (image.shape[1], image.shape[0]))
-
-        overlay_rgb = transformed_element_img[:, :, :3] # RGB channels of the drawable element
-        overlay_alpha = transformed_element_img[:, :, 3] / 255.0 # The alpha channel of the drawable element
-        image_alpha = 1.0 - overlay_alpha
-        for c in range(3):
-            image[:, :, c] = (overlay_rgb[:, :, c] * overlay_alpha +
-                              image[:, :, c] * image_alpha).astype(np.uint8)
-        # Compute the final alpha channel
-        image[:, :, 3] = ((overlay_alpha + (image[:, :, 3] / 255) * (1.0 - overlay_alpha)) * 255).astype(np.uint8)
+                                                 (box.width, box.height),
+                                                 flags=cv2.INTER_NEAREST if fast else cv2.INTER_LINEAR)
+        image_box = image[box.top : box.top + box.height, box.left : box.left + box.width]
+        blend_over(image_box, transformed_element_img, out=image_box)
 
     def get_touch_element(self, x, y, r) -> DrawableElement:
-        return self.layers[self.active_layer_index].get_touched_element(x, y, r)
\ No newline at end of file
+        return self.layers[self.active_layer_index].get_touched_element(x, y, r)
+
+    def get_nearest_element(self, x, y, r) -> DrawableElement:
+        '''
+        Get the element of the active layer nearest to (x, y) within the radius r or None
+        '''
+        return self.layers[self.active_layer_index].get_nearest_element(x, y, r)[0]
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import partial
+from typing import Dict
+from PyQt5.QtCore import QObject, pyqtSignal
+from src.config import config
+
+class ImageWriter(QObject):
+    '''
+    Encode and write images on a pool of worker threads so that saving does not block the GUI.
+    Several saves can be encoded at the same time. If the same path is saved several times
+    the most recently submitted image is the one which ends up on disk.
+    '''
+
+    # Signals with the path of the image. Emitted from the worker threads, delivered in the GUI thread
+    signal_saved = pyqtSignal(str)
+    signal_failed = pyqtSignal(str, str) # path, error message
+
+    def __init__(self):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=config['writer']['max_workers'],
+                                           thread_name_prefix='ImageWriter')
+        self.lock = threading.Lock()
+        self.written:Dict[str, int] = {} # path -> sequence number of the last written image
+        self.sequence = 0
+
+    def submit(self, path:str, image:np.ndarray, encoder:str=None) -> Future:
+        '''
+        Queue an image to be written. The image must not be modified after it is submitted.
+
+        Parameters:
+            path: the path of the file. The extension is replaced by the extension of the encoder
+            image: a cv2 image (BGR or BGRA)
+            encoder: the name of the encoder. By default the encoder set in config.json
+        Returns:
+            Future: resolves once the image is written
+        '''
+        # The encoders (and cv2) are imported on the first save to keep the startup fast
+        from src.utils.image_encoders import get_encoder
+        path = os.path.splitext(path)[0] + get_encoder(encoder)['extension']
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+        future = self.executor.submit(self.write, path, image, encoder, sequence)
+        future.add_done_callback(partial(self.on_done, path))
+        return future
+
+    def write(self, path:str, image:np.ndarray, encoder:str, sequence:int) -> None:
+        '''
+        Encode and write an image. Runs on a worker thread.
+        '''
+        from src.utils.image_encoders import encode_image
+        # Encoding is the slow part and runs in parallel for different saves
+        data = encode_image(image, encoder)
+        with self.lock:
+            # Do not overwrite a newer image of the same path which has already been written
+            if self.written.get(path, 0) > sequence:
+                return
+            with open(path, 'wb') as file:
+                file.write(data)
+            self.written[path] = sequence
+
+    def on_done(self, path:str, future:Future) -> None:
+        '''
+        Report the result of a write through the Qt signals
+        '''
+        exception = future.exception()
+        if exception is None:
+            self.signal_saved.emit(path)
+        else:
+            self.signal_failed.emit(path, str(exception))
+
+    def shutdown(self) -> None:
+        '''
+        Wait for all the queued images to be written
+        '''
+        self.executor.shutdown(wait=True)
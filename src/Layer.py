@@ -1,17 +1,44 @@
-import cv2
 import numpy as np
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 import copy
 from src.DrawableElement import DrawableElement
+from src.utils.blending import blend_over
+from src.utils.Box import Box, box_intersection, box_union
+from src.utils.TileGrid import TileGrid
+from src.utils.SpatialGrid import SpatialGrid
+from src.utils.parallel import map_tiles
+from src.config import config
+
+class TransformSession:
+    '''
+    The composites of a layer below and above an element which is being moved, rotated or resized.
+    They do not change during the transformation, so only the element has to be blended again.
+    '''
+    def __init__(self, element:DrawableElement, image_below:np.ndarray, image_above:np.ndarray, box:Optional[Box]):
+        self.element = element
+        self.image_below = image_below # the starting image with the elements below the element
+        self.image_above = image_above # transparent premultiplied image with the elements above the element
+        self.box = box # the area of the final image covered by the element after the last update
+        self.fast = False # was the element blended with fast interpolation in the last update
 
 class Layer:
     def __init__(self, image_processor, image=None, visible=True):
         self.image_processor = image_processor
         self.image = image # The starting image on which we draw
-        self.final_image = copy.deepcopy(image)
+        self.final_image = copy.deepcopy(image) # The starting image with the elements on top. Premultiplied BGRA
         self.visible = visible # Is the layer visible
         self.drawing_enabled = False
         self.elements:List[DrawableElement] = []
+        self.transform_session:TransformSession = None # set while an element is being transformed
+        self.tiles:TileGrid = None # the tiles of the final image which have to be composited again
+        self.element_boxes:Dict[DrawableElement, Box] = {} # the area where each element was last composited
+        # The order in which the elements were added. Elements are never reordered so it is their z-order
+        self.element_order:Dict[DrawableElement, int] = {}
+        self.num_added_elements = 0
+        self.generation = 0 # incremented whenever the content of final_image changes
+        # The bounding box of every element in the coordinates of the layer for finding touched elements
+        self.element_grid = SpatialGrid(config['compositor']['tile_size'])
+        self.create_tiles()
 
     def toggle_visibility(self):
         self.visible = not self.visible
@@ -25,11 +52,23 @@ class Layer:
             element: the drawable element to be added
         '''
         self.elements.append(element) # add the drawable element
+        self.element_order[element] = self.num_added_elements
+        self.num_added_elements += 1
         self.image_processor.render_element(element, redraw=False) # render the drawable element
+        # The element is on top so it can be blended directly without compositing its tiles again
         self.image_processor.overlay_element_on_image(self.final_image, element)
+        self.element_boxes[element] = self.get_element_box(element)
+        self.update_element_grid(element)
+        self.generation += 1
 
     def remove_element(self, index:int) -> None:
+        '''
+        Remove an element and mark the tiles it covered to be composited again
+        '''
         if 0 <= index < len(self.elements):
+            self.invalidate(self.element_boxes.pop(self.elements[index], None))
+            self.element_grid.remove(self.elements[index])
+            self.element_order.pop(self.elements[index], None)
             del self.elements[index]
 
     def get_elements(self:DrawableElement) -> List[DrawableElement]:
@@ -51,6 +90,112 @@ class Layer:
     # Rendering #
     #############
 
+    def set_image(self, image:np.ndarray, translation:Tuple[float, float]=(0, 0)) -> None:
+        '''
+        Replace the starting image of the layer and keep the elements. The final image is reused if
+        the size does not change. The elements are not redrawn.
+
+        Parameters:
+            image: the new starting image. It is not modified
+            translation: (tx, ty) added to the transformation of every element
+        '''
+        for element in self.elements:
+            element.get_transformation()[:, 2] += translation
+            self.update_element_grid(element)
+        self.transform_session = None # the cached composites are for the previous image
+        self.image = image
+        if self.final_image is None or self.final_image.shape != image.shape:
+            self.final_image = np.empty_like(image)
+        self.create_tiles()
+        # The tiles are composited when they are needed (see composite)
+        self.invalidate()
+
+    def create_tiles(self) -> None:
+        '''
+        Create the tile grid for the size of the starting image if it does not exist or has another size
+        '''
+        if self.image is None:
+            self.tiles = None
+            return
+        height, width = self.image.shape[:2]
+        if self.tiles is None or (self.tiles.width, self.tiles.height) != (width, height):
+            self.tiles = TileGrid(width, height, config['compositor']['tile_size'])
+
+    def invalidate(self, box:Optional[Box]=None) -> None:
+        '''
+        Mark the tiles overlapping a box to be composited again. By default mark all tiles
+        '''
+        self.generation += 1
+        if box is None:
+            self.tiles.mark_dirty()
+        elif box.width > 0 and box.height > 0:
+            self.tiles.mark_dirty(box)
+
+    def invalidate_element(self, drawable_element:DrawableElement) -> None:
+        '''
+        Mark the tiles which an element covered when it was last composited and the tiles it covers now
+        '''
+        old_box = self.element_boxes.get(drawable_element)
+        if old_box is not None:
+            self.invalidate(old_box)
+        new_box = self.get_element_box(drawable_element)
+        if new_box is not None:
+            self.invalidate(new_box)
+        self.update_element_grid(drawable_element)
+
+    def update_element_grid(self, drawable_element:DrawableElement) -> None:
+        '''
+        Put an element at its current bounding box in the spatial grid e.g. after its transformation changed
+        '''
+        self.element_grid.insert(drawable_element, drawable_element.get_bounding_box())
+
+    def composite(self, box:Optional[Box]=None) -> Optional[Box]:
+        '''
+        Composite the dirty tiles of the final image again from the starting image and the elements
+        which overlap them.
+
+        Parameters:
+            box: only composite the dirty tiles overlapping this box. By default composite all dirty tiles
+        Returns:
+            Box: the bounding box of the composited tiles or None if no tile was dirty
+        '''
+        tiles = self.tiles.take_dirty_tiles(box)
+        if not tiles:
+            return None
+        # The boxes of the elements as (left, top, right, bottom) to find the elements overlapping a tile
+        element_boxes = np.zeros((len(self.elements), 4), dtype=np.int64)
+        for i, element in enumerate(self.elements):
+            element_box = self.get_element_box(element)
+            self.element_boxes[element] = element_box
+            if element_box is not None:
+                element_boxes[i] = (element_box.left, element_box.top,
+                                    element_box.left + element_box.width, element_box.top + element_box.height)
+
+        def composite_tile(tile:Box) -> None:
+            area = (slice(tile.top, tile.top + tile.height), slice(tile.left, tile.left + tile.width))
+            np.copyto(self.final_image[area], self.image[area])
+            overlapping = np.nonzero((element_boxes[:, 0] < tile.left + tile.width) &
+                                     (element_boxes[:, 2] > tile.left) &
+                                     (element_boxes[:, 1] < tile.top + tile.height) &
+                                     (element_boxes[:, 3] > tile.top))[0]
+            for i in overlapping:
+                self.image_processor.overlay_element_on_image(self.final_image, self.elements[i], box=tile)
+
+        # The tiles do not overlap so they can be composited in parallel
+        map_tiles(composite_tile, tiles)
+        changed = tiles[0]
+        for tile in tiles[1:]:
+            changed = box_union(changed, tile)
+        return changed
+
+    def render_layer_soft(self) -> None:
+        '''
+        Rerender the layer by adding the already drawn elements to the starting image.
+        Unlike render_layer_hard the elements are not redrawn from instructions and the final image is reused.
+        '''
+        self.invalidate()
+        self.composite()
+
     def render_layer_hard(self) -> None:
         '''
         Rerender the whole layer by rerendering every element and adding it.
@@ -58,37 +203,92 @@ class Layer:
         Note that the starting image (self.image) might already contain some drawable elements which are no longer
         kept as elements but are drawn straight on the image
         '''
-        # Reset the final image
-        self.final_image = copy.deepcopy(self.image)
+        self.transform_session = None
         for element in self.elements:
             # Rerender every element
             self.image_processor.render_element(element, redraw=True)
-            # Add the elements to the layer
-            self.image_processor.overlay_element_on_image(self.final_image, element)
+            self.update_element_grid(element)
+        # Add the elements to the layer
+        self.render_layer_soft()
 
-    def rerender_after_element_update(self, drawable_element:DrawableElement, redraw:bool=False) -> None:
+    def rerender_after_element_update(self, drawable_element:DrawableElement, redraw:bool=False) -> Optional[Box]:
         '''
         Rerenders the layer after a single element has been updated. The element will not be redrawn.
 
         Parameters:
             drawable_element - the drawable element to redraw. Must be from the list self.elements
             redraw - whether to redraw the drawable element from instructions
+        Returns:
+            Box: the area of the final image which changed or None if nothing changed
+        '''
+        self.transform_session = None
+        if redraw:
+            self.image_processor.render_element(drawable_element, redraw=True)
+        # Only the tiles covered by the element before and after the update are composited again
+        self.invalidate_element(drawable_element)
+        return self.composite()
+
+    def begin_transform(self, drawable_element:DrawableElement) -> None:
+        '''
+        Start a transformation (e.g. dragging) of an element. Render the elements below and above it
+        once so that update_transform only has to blend the element.
+
+        Parameters:
+            drawable_element - the element which will be transformed. Must be from the list self.elements
         '''
-        # Find the index of the updated drawable element
+        # The composites are made from the final image so it has to be up to date
+        self.composite()
         element_index = self.get_element_index(drawable_element)
+        image_below = self.image.copy()
+        for element in self.elements[:element_index]:
+            self.image_processor.overlay_element_on_image(image_below, element)
+        image_above = self.render_partial_layer(element_index + 1, len(self.elements))
+        self.transform_session = TransformSession(drawable_element, image_below, image_above,
+                                                  self.get_element_box(drawable_element))
 
-        # Render everything below the chosen drawable element
-        image_below = self.render_partial_layer(0, end_index=element_index)
+    def update_transform(self, fast:bool=False) -> Optional[Box]:
+        '''
+        Update the final image after the transformation of the element of the transform session changed.
+        Only the area covered by the element before or after the change is composited again.
 
+        Parameters:
+            fast: warp the element with nearest neighbour interpolation e.g. while it is dragged
+        Returns:
+            Box: the area of the final image which changed or None if nothing changed
+        '''
+        session = self.transform_session
+        new_box = self.get_element_box(session.element)
+        self.element_boxes[session.element] = new_box
+        self.update_element_grid(session.element)
+        if session.box is None or new_box is None:
+            box = session.box or new_box
+        else:
+            box = box_union(session.box, new_box)
+        session.box = new_box
+        session.fast = fast
+        if box is None:
+            return None
+        self.generation += 1
+        area = (slice(box.top, box.top + box.height), slice(box.left, box.left + box.width))
+        np.copyto(self.final_image[area], session.image_below[area])
+        self.image_processor.overlay_element_on_image(self.final_image, session.element, fast=fast)
+        # The elements above were blended onto a transparent image so image_above is premultiplied
+        blend_over(self.final_image[area], session.image_above[area], out=self.final_image[area],
+                   premultiplied_top=True)
+        return box
 
-        # Render everything above the chosen drawable element
-        image_above = self.render_partial_layer(start_index=element_index, end_index=len(self.elements))
+    def end_transform(self) -> None:
+        '''
+        End the transformation of the element and free the cached composites
+        '''
+        self.transform_session = None
 
-        # Combine image_below, the drawable element, and image_above to get the final image
-        self.final_image = copy.deepcopy(self.image)
-        self.final_image = self.image_processor.overlay_images(self.final_image, image_below)
-        self.image_processor.overlay_element_on_image(self.final_image, drawable_element)
-        self.final_image = self.image_processor.overlay_images(self.final_image, image_above)
+    def get_element_box(self, drawable_element:DrawableElement) -> Optional[Box]:
+        '''
+        Get the area of the final image covered by an element or None if it is outside of the image
+        '''
+        height, width = self.final_image.shape[:2]
+        return box_intersection(drawable_element.get_bounding_box(), Box(0, 0, width, height))
 
     def render_partial_layer(self, start_index:int, end_index:int) -> np.ndarray:
         '''
@@ -115,18 +315,46 @@ class Layer:
             DrawablElement: return the topmost drawable element that was clicked.
                 If there is no such element return None
         '''
-        for element in reversed(self.elements):
+        # Only the elements whose bounding box is near the point can be touched
+        candidates = self.element_grid.query(Box(x - r, y - r, 2 * r + 1, 2 * r + 1))
+        for element in sorted(candidates, key=self.element_order.get, reverse=True):
             if element.is_touched(x, y, r):
                 return element
 
+    def get_nearest_element(self, x:int, y:int, r:int) -> Tuple[Optional[DrawableElement], Optional[float]]:
+        '''
+        Get the element which has a pixel nearest to a point within a radius e.g. the closest thin stroke
+
+        Parameters:
+            x - the x coordinate
+            y - the y coordinate
+            r - the radius around (x, y)
+        Returns:
+            Tuple[DrawableElement, float]: the element and the distance. If several elements are equally near
+                the topmost is returned. (None, None) if no element is in the radius
+        '''
+        nearest, nearest_distance = None, None
+        candidates = self.element_grid.query(Box(x - r, y - r, 2 * r + 1, 2 * r + 1))
+        for element in sorted(candidates, key=self.element_order.get, reverse=True):
+            distance = element.get_touch_distance(x, y, r)
+            if distance is not None and (nearest_distance is None or distance < nearest_distance):
+                nearest, nearest_distance = element, distance
+        return nearest, nearest_distance
+
 class FakeLayer(Layer):
     def __init__(self, image_processor, image=None, visible=True):
         super().__init__(image_processor, image, visible)
 
-    def clear_final_image(self) -> None:
+    def clear_final_image(self, box:Box=None) -> None:
         '''
         Clears just the final_image of the layer. This is used when we have drawn
         directly to the final_image without modifying the actual contents of the layer
+
+        Parameters:
+            box: only clear this area e.g. where a stroke was drawn. By default clear everything
         '''
-        self.final_image = np.zeros_like(self.final_image)
+        if box is None:
+            self.final_image.fill(0)
+        else:
+            self.final_image[box.top : box.top + box.height, box.left : box.left + box.width] = 0
 
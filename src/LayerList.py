@@ -1,4 +1,4 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QListWidget, QListWidgetItem, QLabel
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QListWidget, QListWidgetItem, QLabel, QPushButton
 from PyQt5.QtCore import Qt
 
 class LayerListWidget(QWidget):
@@ -8,25 +8,35 @@ class LayerListWidget(QWidget):
 
         # Initialize the list widget and layout
         self.layer_list = QListWidget()
+        self.button_add_layer = QPushButton("Add layer")
         self.layout = QVBoxLayout()
         self.layout.addWidget(QLabel("Layers"))
         self.layout.addWidget(self.layer_list)
+        self.layout.addWidget(self.button_add_layer)
         self.setLayout(self.layout)
 
         # Connect layer item change signals
         self.layer_list.itemChanged.connect(self.toggle_layer_visibility)
         self.layer_list.itemClicked.connect(self.on_layer_selected)
+        self.button_add_layer.clicked.connect(lambda: self.image_processor.add_layer())
+        # Refresh the list when the image processor changes its layers
+        self.image_processor.layers_changed.connect(self.update_layer_list)
 
         # Populate the list with the current layers
         self.update_layer_list()
 
     def update_layer_list(self):
         """Refreshes the layer list to reflect the current layers in the image processor."""
+        # Do not treat the check states of the new items as changes of the visibility
+        self.layer_list.blockSignals(True)
         self.layer_list.clear()
         for i, layer in enumerate(self.image_processor.layers):
             layer_item = QListWidgetItem(f"Layer {i + 1} {'(Visible)' if layer.visible else '(Hidden)'}")
             layer_item.setCheckState(Qt.Checked if layer.visible else Qt.Unchecked)
             self.layer_list.addItem(layer_item)
+        if self.image_processor.layers:
+            self.layer_list.setCurrentRow(self.image_processor.active_layer_index)
+        self.layer_list.blockSignals(False)
 
     def on_layer_selected(self, item):
         """Sets the selected layer as the active layer in the image processor."""
@@ -36,5 +46,6 @@ class LayerListWidget(QWidget):
     def toggle_layer_visibility(self, item):
         """Toggles the visibility of the layer based on the check state."""
         index = self.layer_list.row(item)
-        self.image_processor.toggle_layer_visibility(index)
-        self.update_layer_list()
+        if (item.checkState() == Qt.Checked) != self.image_processor.layers[index].visible:
+            # The image processor signals the change and the list is refreshed
+            self.image_processor.toggle_layer_visibility(index)
@@ -130,6 +130,7 @@ class RotatableBox(QWidget):
                 # Drag the box
                 self.current_action = actions.move
                 self.shown_drag_offset = mouse_position - QPoint(int(self.shown_left), int(self.shown_top))
+                self.image_processor.begin_element_transformation(self.drawable_element)
                 return
             elif zone_clicked == zone_areas.circle:
                 # Rotate the box
@@ -137,12 +138,14 @@ class RotatableBox(QWidget):
                 self.shown_center_x_original, self.shown_center_y_original = self.get_shown_center()
                 self.original_transformation = self.drawable_element.get_transformation()
                 self.initial_angle = self.get_angle_from_center(mouse_position)
+                self.image_processor.begin_element_transformation(self.drawable_element)
                 return
             elif zone_clicked != zone_areas.outside:
                 # Resize the box
                 self.current_action = actions.resize
                 self.last_clicked_zone = zone_clicked
                 self.original_transformation = self.drawable_element.get_transformation()
+                self.image_processor.begin_element_transformation(self.drawable_element)
                 return
         self.target.mousePressEvent(event)
 
@@ -158,6 +161,8 @@ class RotatableBox(QWidget):
             self.target.mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
+        if self.current_action != actions.none:
+            self.image_processor.end_element_transformation()
         self.current_action = actions.none
         self.update_cursor(self.get_zone(event.pos()))
         self.target.mouseReleaseEvent(event)
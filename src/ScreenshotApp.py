@@ -1,32 +1,69 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QPushButton, QLineEdit, QSpinBox, QLabel
-from PyQt5.QtCore import pyqtSlot, Qt
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtCore import pyqtSlot, Qt, QTimer, QEventLoop
+from PyQt5.QtGui import QPixmap, QImage, QCursor
 from src.TransparentWindow import TransparentWindow
 from src.ZoomableLabel import ZoomableLabel
 from src.ZoomableWidget import ZoomableWidget
 from src.ImageProcessor import ImageProcessor
 from src.ImageProcessingToolSetting import ImageProcessingToolSetting
-from mss import mss
-import cv2
-import numpy as np
+from src.LayerList import LayerListWidget
+from src.CaptureService import CaptureService
+from src.ImageWriter import ImageWriter
+from src.FrameCoalescer import FrameCoalescer
 import os
-from src.utils.Box import Box
+from contextlib import contextmanager
+from typing import List
+from src.utils.Box import Box, box_intersects
+from src.utils.startup_profile import startup_profile
 from src.config import *
 
 class ScreenshotApp(QWidget):
-    def __init__(self):
+    def __init__(self, resident:bool=False):
+        '''
+        Parameters:
+            resident: run as a resident process which is controlled through the CaptureServer.
+                The selection overlay is created in advance so that it can be shown immediately.
+        '''
         super().__init__()
-        self.screenshot_image = None
+        self.resident = resident
+        self.capture = None # the Capture (BGRA image) of the monitors shown in the TransparentWindow
+        self.grabbing = False # our windows are hidden while the screen is grabbed
+        self.capture_service = CaptureService() # owns the mss session used for every grab
+        startup_profile.mark('create CaptureService')
+        self.image_writer = ImageWriter() # writes images to disk in the background
+        self.image_writer.signal_saved.connect(self.on_image_saved)
+        self.image_writer.signal_failed.connect(self.on_image_save_failed)
+        # Merge the selection changes while dragging/resizing into at most one preview update per frame
+        self.selection_coalescer = FrameCoalescer(config['live_preview']['fps'], self)
+        self.selection_coalescer.triggered.connect(self.update_screenshot_selection)
+        self.selection_coalescer.triggered.connect(self.update_screenshot_live)
         self.zoomable_widget = ZoomableWidget(self)
         self.tool_settings_widget = ImageProcessingToolSetting()
         self.image_processor = ImageProcessor(self.zoomable_widget, self.tool_settings_widget)
+        startup_profile.mark('create editor widgets')
 
         self.zoomable_widget.zoomable_label.draw_signal.connect(self.image_processor.on_mouse_move)
         self.zoomable_widget.zoomable_label.start_draw_signal.connect(self.image_processor.on_mouse_down)
         self.zoomable_widget.zoomable_label.stop_draw_signal.connect(self.image_processor.on_mouse_up)
-        self.zoomable_widget.zoomable_label.new_image_signal.connect(self.image_processor.on_new_image)
 
         self.initGUI()
+        startup_profile.mark('initialise GUI')
+
+        if self.resident:
+            self.create_transparent_window()
+            startup_profile.mark('create TransparentWindow')
+            # Load what the first capture needs once the event loop is idle
+            QTimer.singleShot(0, self.warm_up)
+
+    def warm_up(self) -> None:
+        '''
+        Import the modules and create the tools which are otherwise loaded on first use,
+        so that the first capture of the resident process is not slower than the next ones
+        '''
+        import cv2
+        import src.utils.image_encoders
+        for tool_name in self.image_processor.tool_classes:
+            self.image_processor.get_tool(tool_name)
 
     def initGUI(self):
         '''
@@ -51,8 +88,13 @@ class ScreenshotApp(QWidget):
         h_layout.addWidget(self.button_close_screenshot)
         self.layout.addLayout(h_layout)
 
-        # Label to display the screenshot
-        self.layout.addWidget(self.zoomable_widget)
+        # Label to display the screenshot and the list of layers next to it
+        view_layout = QHBoxLayout()
+        view_layout.addWidget(self.zoomable_widget)
+        self.layer_list_widget = LayerListWidget(self.image_processor)
+        self.layer_list_widget.setFixedWidth(160)
+        view_layout.addWidget(self.layer_list_widget)
+        self.layout.addLayout(view_layout)
 
         # Image Processor sublayout
         self.layout.addWidget(self.image_processor)
@@ -67,10 +109,12 @@ class ScreenshotApp(QWidget):
         self.label_size = QLabel('Size(w,h)')
         self.field_width = QSpinBox(self)
         self.field_height = QSpinBox(self)
-        self.field_left.setRange(0, config['monitor']['width'])
-        self.field_top.setRange(0, config['monitor']['height'])
-        self.field_width.setRange(0, config['monitor']['width'])
-        self.field_height.setRange(0, config['monitor']['height'])
+        # The position is in desktop coordinates which span all monitors
+        desktop = self.capture_service.desktop
+        self.field_left.setRange(desktop.left, desktop.left + desktop.width)
+        self.field_top.setRange(desktop.top, desktop.top + desktop.height)
+        self.field_width.setRange(0, desktop.width)
+        self.field_height.setRange(0, desktop.height)
         self.field_left.valueChanged.connect(self.on_change_selection)
         self.field_top.valueChanged.connect(self.on_change_selection)
         self.field_width.valueChanged.connect(self.on_change_selection)
@@ -92,37 +136,160 @@ class ScreenshotApp(QWidget):
         self.setLayout(self.layout)
 
     def on_take_screenshot(self):
+        self.capture_region()
+
+    def capture_region(self, monitor=None) -> None:
+        '''
+        Capture a monitor and let the user select a region of it
+
+        Parameters:
+            monitor: "cursor" for the monitor under the mouse cursor or the mss index of the monitor.
+                By default capture.monitor of the config
+        '''
+        if monitor is None:
+            monitor = config['capture']['monitor']
+        if monitor == 'cursor':
+            cursor_position = QCursor.pos()
+            monitor = self.capture_service.get_monitor_at(cursor_position.x(), cursor_position.y())
+        self.start_capture(monitor)
 
-        # Take a screenhot
-        with mss() as sct:
-            screenshot = sct.grab({'left': 0, 'top': 0, 'width': 1920, 'height': 1080})
-            self.screenshot_image = cv2.cvtColor(np.array(screenshot), cv2.COLOR_BGRA2BGR) # convert to opencv image
-            cv2.imwrite(config['paths']['screenshot_background'], self.screenshot_image)
-        # Open a windoe with the background being the screenshot
-        self.transparent_window = TransparentWindow()
+    def capture_full(self) -> None:
+        '''
+        Capture all monitors and select everything
+        '''
+        self.start_capture(0, select_all=True)
+
+    def capture_monitor(self, n:int) -> None:
+        '''
+        Capture a single monitor and select all of it
+
+        Parameters:
+            n: the mss index of the monitor (1 is the first monitor)
+        '''
+        self.start_capture(n, select_all=True)
+
+    def start_capture(self, monitor:int, select_all:bool=False) -> None:
+        '''
+        Take a screenshot of a monitor and show it in the TransparentWindow for selecting a region
+
+        Parameters:
+            monitor: the mss index of the monitor. 0 is all monitors
+            select_all: select the whole screenshot instead of keeping the previous selection
+        '''
+        # Take a screenhot without our own windows (e.g. the selection overlay of the previous screenshot)
+        with self.own_windows_hidden([self.capture_service.get_monitor_box(monitor)]):
+            self.capture = self.capture_service.capture_monitor(monitor)
+        self.image_processor.clear() # the annotations belong to the previous screenshot
+        if config['capture']['save_background']:
+            self.save_screenshot_background()
+        # Show a window with the background being the screenshot (passed in memory)
+        if self.transparent_window is None:
+            self.create_transparent_window()
+        self.transparent_window.set_capture(self.capture)
         self.transparent_window.show()
+        self.transparent_window.raise_()
+        if self.resident:
+            self.show()
+        if select_all:
+            self.transparent_window.set_draggable_widget(Box(0, 0, self.capture.box.width, self.capture.box.height))
+        else:
+            # Show the kept selection of the new screenshot in the editor (the old document was cleared)
+            self.update_screenshot_selection()
+            self.update_screenshot_live()
+
+    @contextmanager
+    def own_windows_hidden(self, areas:List[Box]):
+        '''
+        Hide the windows of the app which overlap areas of the desktop while they are grabbed and show them again
+        afterwards. Hiding only requests the window manager to unmap the windows, so the grab waits until the
+        event loop processed the hiding and the windows below were repainted.
+
+        Parameters:
+            areas: the areas which are grabbed in desktop coordinates
+        '''
+        if self.grabbing:
+            raise RuntimeError('A capture is already in progress')
+        windows = [window for window in (self, self.transparent_window)
+                   if window is not None and window.isVisible() and
+                   any(box_intersects(get_window_box(window), area) for area in areas)]
+        self.grabbing = True
+        try:
+            for window in windows:
+                window.hide()
+            if windows:
+                wait(config['capture']['hide_delay_ms'])
+            yield
+        finally:
+            for window in windows:
+                window.show()
+            self.grabbing = False
+
+    def create_transparent_window(self) -> None:
+        '''
+        Create the (hidden) TransparentWindow used for selecting a region of the screenshot.
+        The window is reused for the following screenshots.
+        '''
+        self.transparent_window = TransparentWindow(self.capture)
         # Connect the signal from the DraggableBox for screenshot selection (tracks any movement)
-        self.transparent_window.draggable_widget.signal_selection_change_light.connect(self.update_screenshot_selection)
-        self.transparent_window.signal_selection_change.connect(self.update_screenshot_selection)
+        self.transparent_window.draggable_widget.signal_selection_change_light.connect(self.selection_coalescer.request)
         # Connect the signal from the TransparentWindow to get updates of the selection (not while dragging/resizing)
-        self.transparent_window.signal_selection_change.connect(self.update_screenshot_live)
+        self.transparent_window.signal_selection_change.connect(self.on_selection_change_finished)
+
+    def extend_capture(self, selection:Box) -> None:
+        '''
+        Make sure that the capture contains a selection. If the selection is outside the current capture,
+        capture the monitors it touches (reusing the pixels of monitors which are already captured)
+
+        Parameters:
+            selection: the selection in desktop coordinates
+        '''
+        if self.capture.contains(selection):
+            return
+        # Only the monitors which are not captured yet are grabbed. Our windows on them must not be captured
+        missing = [monitor for monitor in self.capture_service.monitors
+                   if box_intersects(monitor, selection) and not self.capture.contains(monitor)]
+        with self.own_windows_hidden(missing):
+            self.capture = self.capture_service.capture_box(selection, previous=self.capture)
+        self.transparent_window.set_capture(self.capture)
+
+    def save_screenshot_background(self):
+        '''
+        Write the full screenshot to disk without blocking the GUI
+        '''
+        self.image_writer.submit(config['paths']['screenshot_background'], self.capture.image)
 
     def on_save(self):
+        '''
+        Save the selection with all of its annotations. The image is composited from memory, the
+        screen is not grabbed again.
+        '''
         try:
-            with mss() as sct:
-                screenshot = sct.grab({'left':self.transparent_window.draggable_widget.selection.left,
-                                       'top':self.transparent_window.draggable_widget.selection.top,
-                                       'width':self.transparent_window.draggable_widget.selection.width,
-                                       'height':self.transparent_window.draggable_widget.selection.height})
-                screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-                cv2.imwrite(config['paths']['screenshot_background'], screenshot)
+            image = self.image_processor.export_image()
+            if image is None:
+                # Nothing is loaded in the editor. Save the selection as it is
+                image = self.capture.crop(self.transparent_window.draggable_widget.selection)
+            self.image_writer.submit(config['paths']['screenshot_selection'], image)
         except Exception as e:
             print(e)
 
+    @pyqtSlot(str)
+    def on_image_saved(self, path:str):
+        '''
+        Handle an image being written to disk by the ImageWriter
+        '''
+        self.button_save.setToolTip(f'Saved to {path}')
+
+    @pyqtSlot(str, str)
+    def on_image_save_failed(self, path:str, error:str):
+        '''
+        Handle an image that could not be written by the ImageWriter
+        '''
+        print(f'Could not save {path}: {error}')
+
     def on_close_screenshot(self):
         if self.transparent_window:
-            self.transparent_window.close()
-            self.transparent_window = None
+            # Keep the window to show it again for the next screenshot
+            self.transparent_window.hide()
 
     def on_change_selection(self):
         '''
@@ -133,8 +300,10 @@ class ScreenshotApp(QWidget):
                             int(self.field_top.text()),
                             int(self.field_width.text()),
                             int(self.field_height.text()))
+            # Capture the monitors of the selection if it is outside the current capture
+            self.extend_capture(selection)
             # Send the selection to the TransparentWindow
-            self.transparent_window.on_change_selection_from_screenshot_app(selection)
+            self.transparent_window.on_change_selection_from_screenshot_app(self.capture.from_desktop(selection))
             # Update the image in the Zoomable label in ScreenshotApp
             self.update_screenshot_live()
         except Exception as e:
@@ -151,7 +320,7 @@ class ScreenshotApp(QWidget):
         self.field_width.blockSignals(True)
         self.field_height.blockSignals(True)
         # Update the Position and Size fields
-        selection = self.transparent_window.draggable_widget.selection
+        selection = self.capture.to_desktop(self.transparent_window.draggable_widget.selection)
         self.field_left.setValue(selection.left)
         self.field_top.setValue(selection.top)
         self.field_width.setValue(selection.width)
@@ -162,21 +331,56 @@ class ScreenshotApp(QWidget):
         self.field_width.blockSignals(False)
         self.field_height.blockSignals(False)
 
+    @pyqtSlot()
+    def on_selection_change_finished(self):
+        '''
+        Handle the end of dragging/resizing the selection. Update immediately with the final selection
+        '''
+        self.selection_coalescer.cancel()
+        self.update_screenshot_selection()
+        self.update_screenshot_live()
+        if config['live_preview']['report_stats']:
+            print(f'Live preview: {self.selection_coalescer.get_stats()}')
+            self.selection_coalescer.reset_stats()
+
     def closeEvent(self, event):
         if self.transparent_window:
             self.transparent_window.close()
         event.accept()
 
+    def shutdown(self):
+        '''
+        Release the resources before the application exits
+        '''
+        self.capture_service.close()
+        # Do not exit before all the saved images are written
+        self.image_writer.shutdown()
+
     def update_screenshot_live(self):
         '''
         Capture the screenshot based on current selection and update the QLabel with the image
         Update the screenshot that is showing in the QLabel element for the creenshot based on the selection 
         '''
         try:
+            # The BGRA view of the capture is passed on without converting or copying it
             selection = self.transparent_window.draggable_widget.selection
-            image = self.screenshot_image[selection.top : selection.top + selection.height,
-                                          selection.left : selection.left + selection.width]
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            self.zoomable_widget.zoomable_label.setImage(image)
+            image = self.capture.crop(selection)
+            desktop_selection = self.capture.to_desktop(selection)
+            self.image_processor.set_view(image, (desktop_selection.left, desktop_selection.top))
         except:
-            return None
\ No newline at end of file
+            return None
+
+def get_window_box(window:QWidget) -> Box:
+    '''
+    Get the area of the desktop covered by a top level window including its frame
+    '''
+    geometry = window.frameGeometry()
+    return Box(geometry.x(), geometry.y(), geometry.width(), geometry.height())
+
+def wait(delay_ms:int) -> None:
+    '''
+    Process the events (except user input) for delay_ms milliseconds without returning to the main event loop
+    '''
+    loop = QEventLoop()
+    QTimer.singleShot(delay_ms, loop.quit)
+    loop.exec_(QEventLoop.ExcludeUserInputEvents)
@@ -1,25 +1,58 @@
 import os
+import numpy as np
 from typing import List
 from PyQt5.QtCore import Qt, QObject, QEvent, QRect, pyqtSignal
-from PyQt5.QtGui import QPainter, QPen, QKeySequence
+from PyQt5.QtGui import QPainter, QPen, QKeySequence, QPixmap
 from PyQt5.QtWidgets import QMainWindow, QWidget, QApplication, QShortcut
-from src.DraggableBox import DraggableBox
+from src.DraggableBox import DraggableBox, get_default_selection
 from src.OverlayWidget import OverlayWidget
 from src.Memento import MementoTransparentWindow
 from src.Caretaker import caretaker
 from src.utils.Box import Box
+from src.utils.image_rendering import bgra_to_qimage
+from src.CaptureService import Capture
 from src.config import *
 
+class ScreenshotBackground(QWidget):
+    '''
+    Widget which paints the screenshot held in memory as its background
+    '''
+    def __init__(self, parent=None, screenshot:np.ndarray=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_OpaquePaintEvent) # The screenshot covers the whole widget
+        self.pixmap = None
+        if screenshot is not None:
+            self.set_screenshot(screenshot)
+
+    def set_screenshot(self, screenshot:np.ndarray) -> None:
+        '''
+        Set the screenshot to paint
+
+        Parameters:
+            screenshot: the BGRA image as grabbed by mss
+        '''
+        self.pixmap = QPixmap.fromImage(bgra_to_qimage(screenshot))
+        self.update()
+
+    def paintEvent(self, event):
+        if self.pixmap is None:
+            return
+        painter = QPainter(self)
+        painter.drawPixmap(event.rect(), self.pixmap, event.rect())
+
 class TransparentWindow(QMainWindow):
 
     signal_selection_change = pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, capture:Capture=None):
         super().__init__()
+        self.capture = capture # the capture shown in the background. The window covers capture.box
+        # Without a capture the window is created in advance and the capture is set with set_capture
         self.initUI()
         self.is_drawing = False # True if we are creating a new draggable widget
         self.start_pos = None
         self.end_pos = None
+        self.has_user_selection = False # False until a selection is made, e.g. by dragging or from the ScreenshotApp
 
         # Create a widget which selects the area of the screenshot to save
         self.draggable_widget = DraggableBox(self, instance_TransparentWindow=self)
@@ -35,12 +68,12 @@ class TransparentWindow(QMainWindow):
         Initialise the gui of the screenshot.
         This is a transparent window whose background is a screenshot
         '''
-        self.setGeometry(0, 0, int(config['monitor']['width']), int(config['monitor']['height']))
+        if self.capture is not None:
+            self.setGeometry(*self.capture.box)
         self.setWindowFlags(Qt.FramelessWindowHint)
 
         # Create a widget which takes the whole space and has background=screenshot
-        self.screenshot_widget =  QWidget(self)
-        self.screenshot_widget.setStyleSheet(f"background-image: url('{config['paths']['screenshot_background']}'); background-repeat: no-repeat;")
+        self.screenshot_widget = ScreenshotBackground(self, None if self.capture is None else self.capture.image)
         self.setCentralWidget(self.screenshot_widget)
 
         # Define the keyboard shortcuts
@@ -117,6 +150,19 @@ class TransparentWindow(QMainWindow):
                     self.mouseReleaseEvent(event, event_pos=event_pos)
         return super().eventFilter(obj, event)
 
+    def set_capture(self, capture:Capture) -> None:
+        '''
+        Show a different capture e.g. after the selection was extended to other monitors.
+        The window is moved to cover the area of the new capture.
+        '''
+        self.capture = capture
+        self.setGeometry(*self.capture.box)
+        self.screenshot_widget.set_screenshot(self.capture.image)
+        self.overlay.setGeometry(self.rect())
+        if not self.has_user_selection:
+            # The default selection may have been made before there was a capture (e.g. in resident mode)
+            self.draggable_widget.on_change_selection(get_default_selection(capture.box.width, capture.box.height))
+
     def on_change_selection_from_screenshot_app(self, selection:Box):
         '''
         Handle the screenshot selection being updated from the main app. Update the selection
@@ -124,7 +170,7 @@ class TransparentWindow(QMainWindow):
         Seave memento
 
         Parameters:
-            selection: (Box) the left, top, width, height selection of the draggable widget
+            selection: (Box) the left, top, width, height selection of the draggable widget relative to the capture
         '''
         self.draggable_widget.on_change_selection(selection)
         self.save_memento(source='ScreenshotApp')
@@ -147,6 +193,7 @@ class TransparentWindow(QMainWindow):
         '''
         Set draggable widget with a given screenshot selection
         '''
+        self.has_user_selection = True
         if self.draggable_widget:
             # Change the selection of the existing DraggableBox
             self.draggable_widget.on_change_selection(selection)
@@ -189,7 +236,9 @@ class TransparentWindow(QMainWindow):
         Parameters:
             source: the source / origin of the memento. Use ScreenshotApp if it comes from the ScreenshotApp
         '''
-        memento = MementoTransparentWindow(selection=self.draggable_widget.selection)
+        self.has_user_selection = True # every selection made by the user is saved
+        # Store the selection in desktop coordinates so that it survives changing the capture
+        memento = MementoTransparentWindow(selection=self.capture.to_desktop(self.draggable_widget.selection))
         memento._source = source
         caretaker.save('TransparentWindow', memento)
 
@@ -197,4 +246,4 @@ class TransparentWindow(QMainWindow):
         '''
         Load a Memento
         '''
-        self.set_draggable_widget(m.selection)
+        self.set_draggable_widget(self.capture.from_desktop(m.selection))
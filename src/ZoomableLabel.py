@@ -1,9 +1,12 @@
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtGui import QPainter, QImage
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal
+from PyQt5.QtGui import QPainter, QImage, QPixmap, QRegion
+from PyQt5.QtCore import Qt, QPoint, QRect, QRectF, pyqtSignal
+import math
 import numpy as np
 from typing import Tuple
 from src.utils.Box import Box
+from src.IdleDetector import IdleDetector
+from src.utils.ImagePyramid import ImagePyramid
 from src.config import config
 from src.utils.Vector import Vect2d
 
@@ -14,9 +17,6 @@ class ZoomableLabel(QLabel):
     start_draw_signal = pyqtSignal(int, int)
     stop_draw_signal = pyqtSignal(int, int)
 
-    # Signal that the original image has been changed to the ImageProcessor
-    new_image_signal = pyqtSignal()
-
     def __init__(self, parent=None):
         super().__init__(parent)
         self.zoomable_widget = parent
@@ -34,11 +34,37 @@ class ZoomableLabel(QLabel):
         self.mouse_pressed = None
 
         self.drawing_enabled = False # Flag to track if drawing mode is active (i.e. send events to ImageProcessor)
-
-    def setImage(self, image):
+        # Object with a composite_area(box) method called before painting to bring that area of
+        # self.transformed_image up to date (e.g. the ImageProcessor compositing its dirty tiles)
+        self.compositor = None
+
+        # QImages sharing the memory of self.transformed_image and its pyramid levels (no copy).
+        # level: (the array the QImage was created for, the memory of the QImage, QImage)
+        self.q_images = {}
+        # Smaller versions of self.transformed_image for showing it zoomed out. Built on first use
+        self.pyramid = None
+
+        # Zooming and panning are drawn with fast filtering. Once the input is idle the view is drawn smoothly
+        self.idle_detector = IdleDetector(config['zoomableLabel']['high_quality_delay_ms'], self)
+        self.idle_detector.idle.connect(self.on_idle)
+        # The shown part of the image scaled to the widget. It is kept until the image, offset,
+        # scale or size of the widget change. Only the dirty region is scaled again
+        self.view_cache = None
+        self.view_cache_key = None
+        self.view_cache_dirty = QRegion() # widget coordinates
+
+    def setImage(self, image, keep_view:bool=False):
         '''
         Set the OpenCV image and convert it to QImage
+
+        Parameters:
+            image: the BGRA image
+            keep_view: keep the zoom and position if the new image has the same size as the old one
         '''
+        if keep_view and self.original_image is not None and self.original_image.shape == image.shape:
+            self.original_image = image
+            self.update_transformed_image(image)
+            return
         self.original_image = image
         # Calculate new initial scale factor
         self.img_height, self.img_width, _ = self.original_image.shape
@@ -60,9 +86,8 @@ class ZoomableLabel(QLabel):
         self.transformed_image = self.original_image
         self.subimage = self.transformed_image
         self.subimage_selection = Box(0, 0, self.img_width, self.img_height)
-
-        # Notify the ImageProcessor of the new Image
-        self.new_image_signal.emit()
+        self.view_cache = None
+        self.invalidate_pyramid()
 
         self.update() # Update the label to repaint with the new image
 
@@ -95,6 +120,7 @@ class ZoomableLabel(QLabel):
         new_mouse_pos_image_y = (mouse_pos_widget.y() - self.offset.y()) / self.scale_factor
         self.offset.setX(self.offset.x() + int((new_mouse_pos_image_x - mouse_pos_image_x) * self.scale_factor))
         self.offset.setY(self.offset.y() + int((new_mouse_pos_image_y - mouse_pos_image_y) * self.scale_factor))
+        self.idle_detector.poke()
         self.update()
 
     def mousePressEvent(self, event):
@@ -129,6 +155,7 @@ class ZoomableLabel(QLabel):
             delta = event.pos() - self.last_mouse_pos
             self.offset += delta
             self.last_mouse_pos = event.pos()
+            self.idle_detector.poke()
             self.update()
 
     def mouseReleaseEvent(self, event):
@@ -152,23 +179,126 @@ class ZoomableLabel(QLabel):
 
         # Update the subimage
         self.update_subimage()
+        if self.compositor is not None:
+            # Only the part of the image which can be shown is composited
+            changed = self.compositor.composite_area(self.subimage_selection)
+            if changed is not None:
+                self.invalidate_pyramid(changed)
+                self.view_cache_dirty += self.get_shown_rect(changed)
 
         # Update the overlay
         if not self.is_overlay_updated():
             self.zoomable_widget.overlay.update()
 
-        # Convert OpenCV image to QImage
-        height, width, channel = self.subimage.shape
-        bytes_per_line = channel * width
-        if channel == 3:
-            q_image = QImage(self.subimage.data.tobytes(), width, height, bytes_per_line, QImage.Format_RGB888)
-        else:
-            q_image = QImage(self.subimage.data.tobytes(), width, height, bytes_per_line, QImage.Format_RGBA8888)
+        # Scale again the parts of the cached view which are out of date
+        key = self.get_view_key()
+        if self.view_cache is None or self.view_cache_key != key:
+            self.view_cache = QPixmap(self.size())
+            self.view_cache_key = key
+            self.render_view(QRegion(self.rect()))
+            if event.rect() != self.rect():
+                self.update() # the rest of the widget shows the old view
+        elif not self.view_cache_dirty.isEmpty():
+            self.render_view(self.view_cache_dirty)
+        self.view_cache_dirty = QRegion()
 
-        # Draw the scaled and translated image
         painter = QPainter(self)
-        scaled_image = q_image.scaled(int(width * self.scale_factor), int(height * self.scale_factor), Qt.IgnoreAspectRatio, Qt.FastTransformation)
-        painter.drawImage(self.offset, scaled_image)
+        painter.drawPixmap(event.rect(), self.view_cache, event.rect())
+
+    def get_q_image(self, image:np.ndarray, level:int=0) -> QImage:
+        '''
+        Get a QImage which shares the memory of an image. It is created again only
+        when the image of the level is a different array.
+
+        Parameters:
+            image: self.transformed_image or one of the levels of its pyramid
+            level: the level of the pyramid
+        '''
+        if level not in self.q_images or self.q_images[level][0] is not image:
+            # QImage needs rows at a fixed stride. The composited images already are contiguous
+            memory = np.ascontiguousarray(image)
+            height, width, channel = memory.shape
+            if channel == 3:
+                image_format = QImage.Format_BGR888
+            else:
+                # Premultiplied BGRA in memory (the layers are composited premultiplied)
+                image_format = QImage.Format_ARGB32_Premultiplied
+            q_image = QImage(memory.data, width, height, memory.strides[0], image_format)
+            self.q_images[level] = (image, memory, q_image) # keep the memory of the QImage alive
+        return self.q_images[level][2]
+
+    def get_pyramid(self) -> ImagePyramid:
+        '''
+        Get the pyramid of self.transformed_image. A new one is created when it is a different array
+        '''
+        if self.pyramid is None or self.pyramid.image is not self.transformed_image:
+            self.pyramid = ImagePyramid(self.transformed_image, config['compositor']['tile_size'])
+        return self.pyramid
+
+    def invalidate_pyramid(self, box:Box=None) -> None:
+        '''
+        Mark an area of the pyramid as out of date. By default the whole pyramid
+        '''
+        if self.pyramid is not None:
+            self.pyramid.invalidate(box)
+
+    def get_view_key(self) -> Tuple:
+        '''
+        Get what the cached view depends on apart from the pixels: the scale, the position of the
+        top left corner of the image in the widget and the size of the widget
+        '''
+        origin = self.convert_image_coordinates_to_shown(0, 0)
+        return (self.scale_factor, origin[0], origin[1], self.width(), self.height())
+
+    def render_view(self, region:QRegion) -> None:
+        '''
+        Scale the visible part of the image into self.view_cache. Only the pixels inside region are drawn.
+
+        Parameters:
+            region: the region of the widget to draw
+        '''
+        painter = QPainter(self.view_cache)
+        # Smooth filtering is only used for scaling down and not during an interaction.
+        # Zoomed in the pixels are kept sharp
+        painter.setRenderHint(QPainter.SmoothPixmapTransform,
+                              self.scale_factor < 1 and not self.idle_detector.interacting)
+        painter.setClipRegion(region)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.fillRect(region.boundingRect(), Qt.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        # Zoomed out, the level of the pyramid which is the smallest but still at least as big as the
+        # shown image is drawn. Scaling it down looks smooth and does not read all pixels of the image
+        level = 0
+        if self.scale_factor < 1:
+            level = min(int(math.log2(1 / self.scale_factor)), self.get_pyramid().get_num_levels() - 1)
+        factor = 2 ** level
+        # The pixels of the level which are visible (rounded outwards to whole pixels)
+        origin_x, origin_y = self.convert_image_coordinates_to_shown(0, 0)
+        level_scale = self.scale_factor * factor
+        level_height, level_width = self.img_height // factor, self.img_width // factor
+        left = max(0, math.floor(-origin_x / level_scale))
+        top = max(0, math.floor(-origin_y / level_scale))
+        right = min(level_width, math.ceil((self.width() - origin_x) / level_scale))
+        bottom = min(level_height, math.ceil((self.height() - origin_y) / level_scale))
+        if left < right and top < bottom:
+            if level == 0:
+                q_image = self.get_q_image(self.transformed_image)
+            else:
+                image = self.get_pyramid().get_level(level, Box(left, top, right - left, bottom - top))
+                q_image = self.get_q_image(image, level)
+            source = QRectF(left, top, right - left, bottom - top)
+            target = QRectF(origin_x + left * level_scale, origin_y + top * level_scale,
+                            (right - left) * level_scale, (bottom - top) * level_scale)
+            painter.drawImage(target, q_image, source)
+        painter.end()
+
+    def on_idle(self) -> None:
+        '''
+        Draw the whole view again with high quality after an interaction
+        '''
+        if self.scale_factor < 1:
+            self.view_cache = None
+            self.update()
 
     def update_subimage(self):
         '''
@@ -201,16 +331,42 @@ class ZoomableLabel(QLabel):
         self.offset.setX(int(self.offset.x() + self.scale_factor * (self.subimage_selection.left - old_subimage_selection.left)))
         self.offset.setY(int(self.offset.y() + self.scale_factor * (self.subimage_selection.top - old_subimage_selection.top)))
 
-    def update_transformed_image(self, image=None):
+    def update_transformed_image(self, image=None, box:Box=None):
         '''
         Update self.transformed_image
+
+        Parameters:
+            image: the new transformed image. By default the current one is kept
+            box: the area of the image which changed. Only the part of the widget showing it is repainted.
+                By default the whole widget is repainted
         '''
         if image is not None:
+            if image is not self.transformed_image:
+                self.view_cache = None
             # Update the transformed image
             self.transformed_image = image
         self.subimage = self.transformed_image[self.subimage_selection.top : self.subimage_selection.top + self.subimage_selection.height,
                                                self.subimage_selection.left : self.subimage_selection.left + self.subimage_selection.width]
-        self.update()
+        self.invalidate_pyramid(box)
+        if box is None:
+            self.view_cache = None
+            self.update()
+            return
+        # Repaint only the part of the widget which shows the box (if it is shown at all)
+        rect = self.get_shown_rect(box)
+        if not rect.isEmpty():
+            self.view_cache_dirty += rect
+            self.update(rect)
+
+    def get_shown_rect(self, box:Box) -> QRect:
+        '''
+        Get the rectangle of the widget which shows a box of the image (empty if it is not shown)
+        '''
+        top_left = self.convert_image_coordinates_to_shown(box.left, box.top)
+        bottom_right = self.convert_image_coordinates_to_shown(box.left + box.width, box.top + box.height)
+        rect = QRect(QPoint(int(top_left[0]) - 1, int(top_left[1]) - 1),
+                     QPoint(int(bottom_right[0]) + 1, int(bottom_right[1]) + 1))
+        return rect.intersected(self.rect())
 
     def convert_to_img_coor(self, x:float=None, y:float=None) -> Tuple[int, int]:
         '''
@@ -1,3 +1,41 @@
 import collections
+from typing import Optional
 
 Box = collections.namedtuple('Box', 'left top width height')
+
+def box_contains(outer:Box, inner:Box) -> bool:
+    '''
+    Check if the box `inner` is fully inside the box `outer`
+    '''
+    return (outer.left <= inner.left and outer.top <= inner.top and
+            inner.left + inner.width <= outer.left + outer.width and
+            inner.top + inner.height <= outer.top + outer.height)
+
+def box_intersects(box0:Box, box1:Box) -> bool:
+    '''
+    Check if two boxes overlap
+    '''
+    return (box0.left < box1.left + box1.width and box1.left < box0.left + box0.width and
+            box0.top < box1.top + box1.height and box1.top < box0.top + box0.height)
+
+def box_intersection(box0:Box, box1:Box) -> Optional[Box]:
+    '''
+    Get the overlap of two boxes or None if they do not overlap
+    '''
+    left = max(box0.left, box1.left)
+    top = max(box0.top, box1.top)
+    right = min(box0.left + box0.width, box1.left + box1.width)
+    bottom = min(box0.top + box0.height, box1.top + box1.height)
+    if right <= left or bottom <= top:
+        return None
+    return Box(left, top, right - left, bottom - top)
+
+def box_union(box0:Box, box1:Box) -> Box:
+    '''
+    Get the smallest box which contains both boxes
+    '''
+    left = min(box0.left, box1.left)
+    top = min(box0.top, box1.top)
+    right = max(box0.left + box0.width, box1.left + box1.width)
+    bottom = max(box0.top + box0.height, box1.top + box1.height)
+    return Box(left, top, right - left, bottom - top)
@@ -0,0 +1,96 @@
+import math
+import numpy as np
+from typing import List
+from src.utils.Box import Box
+from src.utils.TileGrid import TileGrid
+
+class ImagePyramid:
+    '''
+    The image at 1/2, 1/4, 1/8... of its size for showing it zoomed out.
+    Every pixel of a level is the average of 2x2 pixels of the level above it (odd last rows and
+    columns are dropped). The levels are built lazily and only the tiles which changed are built again.
+    '''
+    def __init__(self, image:np.ndarray, tile_size:int):
+        '''
+        Parameters:
+            image: the full resolution image (level 0). It is not copied
+            tile_size: the size of the tiles of every level in pixels of that level
+        '''
+        self.image = image
+        self.tile_size = tile_size
+        self.levels:List[np.ndarray] = [image]
+        self.tiles:List[TileGrid] = [None] # level 0 is never dirty
+
+    def get_num_levels(self) -> int:
+        '''
+        Get the number of levels which can exist (the smallest level is at least 1x1)
+        '''
+        height, width = self.image.shape[:2]
+        return max(1, int(math.log2(max(1, min(width, height)))) + 1)
+
+    def invalidate(self, box:Box=None) -> None:
+        '''
+        Mark an area of every level as out of date after the image changed
+
+        Parameters:
+            box: the area of level 0 which changed. By default the whole image
+        '''
+        for level in range(1, len(self.levels)):
+            if box is None:
+                self.tiles[level].mark_dirty()
+                continue
+            factor = 2 ** level
+            left, top = box.left // factor, box.top // factor
+            right = -(-(box.left + box.width) // factor)
+            bottom = -(-(box.top + box.height) // factor)
+            self.tiles[level].mark_dirty(Box(left, top, right - left, bottom - top))
+
+    def get_level(self, level:int, box:Box=None) -> np.ndarray:
+        '''
+        Get a level of the pyramid. Only the part inside box is guaranteed to be up to date
+
+        Parameters:
+            level: 0 is the image, 1 is half its size and so on
+            box: the area of the level which is needed. By default the whole level
+        Returns:
+            np.ndarray: the level
+        '''
+        level = min(level, self.get_num_levels() - 1)
+        while len(self.levels) <= level:
+            self.add_level()
+        self.update_level(level, box)
+        return self.levels[level]
+
+    def add_level(self) -> None:
+        '''
+        Allocate the next level. All its tiles are dirty
+        '''
+        height, width = self.levels[-1].shape[:2]
+        shape = (height // 2, width // 2) + self.image.shape[2:]
+        self.levels.append(np.empty(shape, dtype=self.image.dtype))
+        self.tiles.append(TileGrid(shape[1], shape[0], self.tile_size))
+
+    def update_level(self, level:int, box:Box=None) -> None:
+        '''
+        Build the dirty tiles of a level inside box from the level above it
+        '''
+        if level == 0:
+            return
+        import cv2
+        tiles = self.tiles[level].take_dirty_tiles(box)
+        if not tiles:
+            return
+        # The level above has to be up to date where the tiles are taken from
+        left = min(tile.left for tile in tiles)
+        top = min(tile.top for tile in tiles)
+        right = max(tile.left + tile.width for tile in tiles)
+        bottom = max(tile.top + tile.height for tile in tiles)
+        self.update_level(level - 1, Box(2 * left, 2 * top, 2 * (right - left), 2 * (bottom - top)))
+        above = self.levels[level - 1]
+        destination = self.levels[level]
+        for tile in tiles:
+            source = above[2 * tile.top : 2 * (tile.top + tile.height),
+                           2 * tile.left : 2 * (tile.left + tile.width)]
+            # INTER_AREA with a factor of exactly 2 averages 2x2 blocks, so tiles do not need borders
+            destination[tile.top : tile.top + tile.height, tile.left : tile.left + tile.width] = \
+                cv2.resize(source, (tile.width, tile.height), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,63 @@
+from typing import Dict, Hashable, Iterator, Set, Tuple
+from src.utils.Box import Box
+
+class SpatialGrid:
+    '''
+    A uniform grid of square cells which remembers which items have a box overlapping each cell.
+    Finds the few items near a point without checking every item.
+    '''
+    def __init__(self, cell_size:int):
+        self.cell_size = cell_size
+        self.cells:Dict[Tuple[int, int], Set[Hashable]] = {} # (row, column) -> items. Empty cells are removed
+        self.boxes:Dict[Hashable, Box] = {} # the box of every item
+
+    def get_cells(self, box:Box) -> Iterator[Tuple[int, int]]:
+        '''
+        Get the (row, column) of the cells overlapping a box. The grid is unbounded
+        '''
+        row_start = box.top // self.cell_size
+        row_end = (box.top + max(1, box.height) - 1) // self.cell_size
+        column_start = box.left // self.cell_size
+        column_end = (box.left + max(1, box.width) - 1) // self.cell_size
+        for row in range(row_start, row_end + 1):
+            for column in range(column_start, column_end + 1):
+                yield row, column
+
+    def insert(self, item:Hashable, box:Box) -> None:
+        '''
+        Add an item or move it to a new box
+        '''
+        self.remove(item)
+        self.boxes[item] = box
+        for cell in self.get_cells(box):
+            self.cells.setdefault(cell, set()).add(item)
+
+    def remove(self, item:Hashable) -> None:
+        '''
+        Remove an item if it is in the grid
+        '''
+        box = self.boxes.pop(item, None)
+        if box is None:
+            return
+        for cell in self.get_cells(box):
+            items = self.cells[cell]
+            items.discard(item)
+            if not items:
+                del self.cells[cell]
+
+    def clear(self) -> None:
+        self.cells = {}
+        self.boxes = {}
+
+    def query(self, box:Box) -> Set[Hashable]:
+        '''
+        Get the items whose boxes overlap a box
+        '''
+        result = set()
+        for cell in self.get_cells(box):
+            for item in self.cells.get(cell, ()):
+                item_box = self.boxes[item]
+                if (item_box.left < box.left + box.width and box.left < item_box.left + item_box.width and
+                    item_box.top < box.top + box.height and box.top < item_box.top + item_box.height):
+                    result.add(item)
+        return result
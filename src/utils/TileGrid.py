@@ -0,0 +1,64 @@
+import math
+import numpy as np
+from typing import List, Tuple
+from src.utils.Box import Box
+
+class TileGrid:
+    '''
+    Split an image into square tiles and keep a dirty flag for every tile.
+    A tile is dirty when its cached pixels no longer match what it should show.
+    '''
+    def __init__(self, width:int, height:int, tile_size:int):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.columns = math.ceil(width / tile_size)
+        self.rows = math.ceil(height / tile_size)
+        self.dirty = np.ones((self.rows, self.columns), dtype=bool) # nothing is cached at the start
+
+    def get_tile_range(self, box:Box) -> Tuple[int, int, int, int]:
+        '''
+        Get the (row_start, row_end, column_start, column_end) of the tiles which overlap a box.
+        The ends are exclusive and the ranges are empty if the box is outside the image.
+        '''
+        row_start = max(0, box.top // self.tile_size)
+        row_end = min(self.rows, -(-(box.top + box.height) // self.tile_size))
+        column_start = max(0, box.left // self.tile_size)
+        column_end = min(self.columns, -(-(box.left + box.width) // self.tile_size))
+        return row_start, max(row_start, row_end), column_start, max(column_start, column_end)
+
+    def get_tile_box(self, row:int, column:int) -> Box:
+        '''
+        Get the box of a tile. The tiles at the right and bottom edge may be smaller than tile_size
+        '''
+        left = column * self.tile_size
+        top = row * self.tile_size
+        return Box(left, top, min(self.tile_size, self.width - left), min(self.tile_size, self.height - top))
+
+    def mark_dirty(self, box:Box=None) -> None:
+        '''
+        Mark the tiles overlapping a box as dirty. By default mark all tiles
+        '''
+        if box is None:
+            self.dirty[:] = True
+            return
+        row_start, row_end, column_start, column_end = self.get_tile_range(box)
+        self.dirty[row_start:row_end, column_start:column_end] = True
+
+    def is_dirty(self) -> bool:
+        return bool(self.dirty.any())
+
+    def take_dirty_tiles(self, box:Box=None) -> List[Box]:
+        '''
+        Get the boxes of the dirty tiles and mark them as clean
+
+        Parameters:
+            box: only take the dirty tiles overlapping this box. By default take all dirty tiles
+        '''
+        if box is None:
+            box = Box(0, 0, self.width, self.height)
+        row_start, row_end, column_start, column_end = self.get_tile_range(box)
+        dirty = self.dirty[row_start:row_end, column_start:column_end]
+        rows, columns = np.nonzero(dirty)
+        dirty[:] = False
+        return [self.get_tile_box(row_start + row, column_start + column) for row, column in zip(rows, columns)]
@@ -0,0 +1,80 @@
+import numpy as np
+
+def div255(values:np.ndarray, scratch:np.ndarray=None) -> np.ndarray:
+    '''
+    Divide uint16 values in [0, 255 * 255] by 255 with rounding, in place.
+    Uses (x + 128 + ((x + 128) >> 8)) >> 8 which is exact for this range.
+
+    Parameters:
+        values: uint16 array. It is overwritten with the result
+        scratch: optional uint16 array with the same shape used as temporary storage
+    Returns:
+        np.ndarray: values
+    '''
+    values += 128
+    scratch = np.right_shift(values, 8, out=scratch)
+    values += scratch
+    values >>= 8
+    return values
+
+def blend_over(image_bottom:np.ndarray,
+               image_top:np.ndarray,
+               out:np.ndarray=None,
+               premultiplied_top:bool=False) -> np.ndarray:
+    '''
+    Place image_top on top of image_bottom using the alpha channel of image_top.
+    All channels are blended at once in 16 bit fixed point:
+        color = (top * alpha + bottom * (255 - alpha)) / 255
+        alpha = alpha + bottom_alpha * (255 - alpha) / 255
+    This is the "over" operator for a premultiplied image_bottom (opaque images are premultiplied)
+    and gives a premultiplied result. With premultiplied_top the color of image_top is not multiplied
+    by its alpha, which is how premultiplied layers are combined.
+
+    Parameters:
+        image_bottom: premultiplied BGRA image with dtype uint8
+        image_top: BGRA image with dtype uint8 and the same shape as image_bottom
+        out: the array where the result is written. May be image_bottom or image_top.
+            By default a new array is created
+        premultiplied_top: whether image_top is premultiplied
+    Returns:
+        np.ndarray: out, a premultiplied BGRA image
+    '''
+    if out is None:
+        out = np.empty_like(image_bottom)
+    # Repeat the alpha of every pixel in its 4 channels by multiplying it as a 64 bit integer
+    # with 4 lanes of 16 bits. This is much faster than broadcasting over an axis of length 4
+    alpha_lanes = image_top[:, :, 3].astype(np.uint64)
+    alpha_lanes *= 0x0001000100010001
+    weights_top = alpha_lanes.view(np.uint16).reshape(image_top.shape)
+    weights_bottom = np.subtract(255, weights_top, dtype=np.uint16)
+    if premultiplied_top:
+        weights_top.fill(255)
+    else:
+        # The alpha of the top image is weighted with 255 instead of with itself
+        weights_top[:, :, 3] = 255
+    result = np.multiply(image_top, weights_top, out=weights_top)
+    below = np.multiply(image_bottom, weights_bottom, out=weights_bottom)
+    result += below
+    div255(result, scratch=below)
+    np.copyto(out, result, casting='unsafe')
+    return out
+
+def unpremultiply(image:np.ndarray) -> np.ndarray:
+    '''
+    Convert a premultiplied BGRA image to straight alpha e.g. before encoding it.
+    Opaque and fully transparent pixels are not changed.
+
+    Parameters:
+        image: premultiplied BGRA image with dtype uint8. It is modified
+    Returns:
+        np.ndarray: image
+    '''
+    alpha = image[:, :, 3]
+    translucent = (alpha > 0) & (alpha < 255)
+    if not translucent.any():
+        return image
+    pixels = image[translucent].astype(np.uint32)
+    pixel_alpha = pixels[:, 3:]
+    pixels[:, :3] = np.minimum((pixels[:, :3] * 255 + pixel_alpha // 2) // pixel_alpha, 255)
+    image[translucent] = pixels
+    return image
@@ -0,0 +1,45 @@
+import os
+import socket
+import tempfile
+from typing import Optional
+
+def get_socket_path(configured:Optional[str]) -> str:
+    '''
+    Get the path of the Unix domain socket of the resident process. The default is private to the user,
+    so the resident processes of different users do not use the same socket
+
+    Parameters:
+        configured: daemon.socket_path of the config. Environment variables and ~ are expanded.
+            If null, screenshot-utility.sock in $XDG_RUNTIME_DIR or, if that is not set,
+            screenshot-utility-<uid>.sock in the temporary directory
+    '''
+    if configured:
+        return os.path.expanduser(os.path.expandvars(configured))
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'screenshot-utility.sock')
+    return os.path.join(tempfile.gettempdir(), f'screenshot-utility-{os.getuid()}.sock')
+
+def send_command(command:str, socket_path:str, timeout:float=5.0) -> str:
+    '''
+    Send a command to the resident ScreenshotApp (see src/CaptureServer.py) and wait for the reply.
+    Only the standard library is used so that the client starts instantly.
+
+    Parameters:
+        command: the command e.g. "capture region"
+        socket_path: the path of the Unix domain socket of the resident process
+        timeout: seconds to wait for the reply
+    Returns:
+        str: the reply, "ok" or "error <message>"
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(f'{command}\n'.encode())
+        reply = b''
+        while not reply.endswith(b'\n'):
+            data = client.recv(1024)
+            if not data:
+                break
+            reply += data
+    return reply.decode().strip()
@@ -0,0 +1,149 @@
+import io
+import cv2
+import numpy as np
+from typing import Callable, Dict, List
+from src.config import config
+
+# Registry of the available encoders: name -> {'extension', 'encode', 'supports_alpha', 'is_available'}
+ENCODERS:Dict[str, dict] = {}
+
+def register_encoder(name:str,
+                     extension:str,
+                     supports_alpha:bool=True,
+                     is_available:Callable[[], bool]=lambda: True):
+    '''
+    Decorator that registers a function encoding a cv2 image to bytes
+
+    Parameters:
+        name: the name of the encoder used in config.json
+        extension: the file extension of the encoded image e.g. ".png"
+        supports_alpha: if False the alpha channel is removed before encoding
+        is_available: returns whether the libraries needed by the encoder are installed
+    '''
+    def decorator(encode:Callable[..., bytes]):
+        ENCODERS[name] = {
+            'extension': extension,
+            'encode': encode,
+            'supports_alpha': supports_alpha,
+            'is_available': is_available,
+        }
+        return encode
+    return decorator
+
+def get_encoder(name:str=None) -> dict:
+    '''
+    Get an encoder from the registry. By default return the encoder set in config.json
+    '''
+    name = config['export']['encoder'] if name is None else name
+    if name not in ENCODERS:
+        raise ValueError(f'Unknown encoder {name}. Available encoders: {", ".join(ENCODERS)}')
+    return ENCODERS[name]
+
+def get_available_encoders() -> List[str]:
+    '''
+    Get the names of the encoders whose libraries are installed
+    '''
+    return [name for name, encoder in ENCODERS.items() if encoder['is_available']()]
+
+def is_opaque(image:np.ndarray) -> bool:
+    '''
+    Check if a cv2 image has no transparent pixels
+    '''
+    return image.ndim == 2 or image.shape[2] < 4 or image[:, :, 3].min() == 255
+
+def encode_image(image:np.ndarray, name:str=None) -> bytes:
+    '''
+    Encode a cv2 image with one of the registered encoders using the options from config.json
+
+    Parameters:
+        image: a BGR or BGRA image
+        name: the name of the encoder. By default the encoder set in config.json
+    Returns:
+        bytes: the encoded image
+    '''
+    name = config['export']['encoder'] if name is None else name
+    encoder = get_encoder(name)
+    options = config['export']['encoders'].get(name, {})
+    # Remove the alpha channel if it is not needed
+    if image.ndim == 3 and image.shape[2] == 4:
+        if not encoder['supports_alpha'] or (config['export']['drop_opaque_alpha'] and is_opaque(image)):
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return encoder['encode'](image, **options)
+
+def cv2_encode(image:np.ndarray, extension:str, params:List[int]) -> bytes:
+    '''
+    Encode an image with cv2.imencode
+    '''
+    success, buffer = cv2.imencode(extension, image, params)
+    if not success:
+        raise IOError(f'Could not encode the image as {extension}')
+    return buffer.tobytes()
+
+############
+# Encoders #
+############
+
+@register_encoder('png', '.png')
+def encode_png(image:np.ndarray, level:int=3) -> bytes:
+    '''
+    PNG with a zlib compression level between 0 (fastest) and 9 (smallest)
+    '''
+    return cv2_encode(image, '.png', [cv2.IMWRITE_PNG_COMPRESSION, level])
+
+def has_pillow() -> bool:
+    try:
+        import PIL
+        return True
+    except ImportError:
+        return False
+
+@register_encoder('png_palette', '.png', is_available=has_pillow)
+def encode_png_palette(image:np.ndarray, colors:int=256, level:int=9) -> bytes:
+    '''
+    PNG quantised to a palette of at most 256 colors. Requires Pillow.
+    '''
+    from PIL import Image
+    if image.shape[2] == 4:
+        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA))
+        pil_image = pil_image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+    else:
+        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        pil_image = pil_image.quantize(colors, method=Image.Quantize.MEDIANCUT)
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format='PNG', compress_level=level)
+    return buffer.getvalue()
+
+@register_encoder('webp', '.webp', is_available=lambda: cv2.haveImageWriter('.webp'))
+def encode_webp(image:np.ndarray, lossless:bool=True, quality:int=90) -> bytes:
+    '''
+    WebP. Lossless by default, otherwise with a quality between 1 and 100
+    '''
+    # cv2 encodes lossless WebP for quality above 100
+    return cv2_encode(image, '.webp', [cv2.IMWRITE_WEBP_QUALITY, 101 if lossless else quality])
+
+@register_encoder('jpeg', '.jpg', supports_alpha=False)
+def encode_jpeg(image:np.ndarray, quality:int=90) -> bytes:
+    '''
+    JPEG with a quality between 0 and 100. The alpha channel is always removed.
+    '''
+    return cv2_encode(image, '.jpg', [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+def has_qoi() -> bool:
+    if cv2.haveImageWriter('.qoi'):
+        return True
+    try:
+        import qoi
+        return True
+    except ImportError:
+        return False
+
+@register_encoder('qoi', '.qoi', is_available=has_qoi)
+def encode_qoi(image:np.ndarray) -> bytes:
+    '''
+    QOI, a very fast lossless format. Uses cv2 if it was built with QOI, otherwise the qoi package.
+    '''
+    if cv2.haveImageWriter('.qoi'):
+        return cv2_encode(image, '.qoi', [])
+    import qoi
+    code = cv2.COLOR_BGRA2RGBA if image.shape[2] == 4 else cv2.COLOR_BGR2RGB
+    return qoi.encode(cv2.cvtColor(image, code))
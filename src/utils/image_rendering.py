@@ -1,5 +1,4 @@
 import numpy as np
-import cv2
 from typing import Tuple
 from PyQt5.QtGui import QPixmap, QImage, QIcon, QPainter
 from PyQt5.QtSvg import QSvgRenderer
@@ -10,18 +9,29 @@ def qpixmap_to_qimage(pixmap: QPixmap) -> QImage:
     return pixmap.toImage()
 
 def qimage_to_cv2(qimage: QImage) -> np.ndarray:
-    """Convert QImage to OpenCV (cv2) image."""
+    """Convert QImage to a BGRA OpenCV (cv2) image."""
+    # Format_ARGB32 is BGRA in memory (with alpha that is not premultiplied)
+    qimage = qimage.convertToFormat(QImage.Format_ARGB32)
     width, height = qimage.width(), qimage.height()
     ptr = qimage.bits()
     ptr.setsize(qimage.byteCount())
-    arr = np.array(ptr).reshape((height, width, 4))
-    cv2_image = cv2.cvtColor(arr, cv2.COLOR_BGRA2RGBA)
-    return cv2_image
+    arr = np.array(ptr).reshape((height, qimage.bytesPerLine() // 4, 4))
+    return arr[:, :width]
 
 def qpixmap_to_cv2(pixmap: QPixmap) -> np.ndarray:
     """Convert QPixmap to OpenCV (cv2) image."""
     return qimage_to_cv2(qpixmap_to_qimage(pixmap))
 
+def bgra_to_qimage(image: np.ndarray) -> QImage:
+    """
+    Wrap a BGRA image (e.g. an mss grab) in an opaque QImage without copying the pixels.
+    The memory layout of BGRA matches QImage.Format_RGB32 on little-endian machines.
+    The alpha byte is ignored because mss does not guarantee that it is valid.
+    The caller must keep `image` alive for as long as the QImage is used.
+    """
+    height, width = image.shape[:2]
+    return QImage(image.data, width, height, image.strides[0], QImage.Format_RGB32)
+
 def create_svg_icon(icon_path:str, size: Tuple[int, int]=(24, 24)):
         '''
         Helper function to create QIcon from SVG file path
@@ -0,0 +1,42 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+from src.utils.Box import Box
+from src.config import config
+
+# The thread pool of the compositor. Created on first use
+_executor:ThreadPoolExecutor = None
+
+def get_num_threads() -> int:
+    '''
+    Get the number of compositor threads set in config.json. 0 means one thread per core
+    '''
+    return config['compositor']['threads'] or os.cpu_count() or 1
+
+def get_executor() -> ThreadPoolExecutor:
+    '''
+    Get the thread pool of the compositor
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_num_threads(), thread_name_prefix='Compositor')
+    return _executor
+
+def map_tiles(function:Callable[[Box], None], tiles:List[Box]) -> None:
+    '''
+    Call function for every tile. If there is enough work the tiles are processed in parallel on the
+    thread pool of the compositor, otherwise they are processed one after the other on this thread.
+    cv2 and NumPy release the GIL while they process pixels so the threads run at the same time.
+
+    Parameters:
+        function: processes one tile. Calls for different tiles must not write to the same pixels
+        tiles: the tiles
+    '''
+    num_pixels = sum(tile.width * tile.height for tile in tiles)
+    if len(tiles) < 2 or get_num_threads() < 2 or num_pixels < config['compositor']['parallel_min_pixels']:
+        for tile in tiles:
+            function(tile)
+        return
+    # Consume the results to raise the exceptions of the workers
+    for _ in get_executor().map(function, tiles):
+        pass
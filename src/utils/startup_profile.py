@@ -0,0 +1,61 @@
+import time
+from typing import List, Tuple
+
+class StartupProfile:
+    '''
+    Record how long each phase of the start of the application takes.
+    Phases are marked where they end. Nothing is recorded unless the profile is enabled.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        self.last = self.start # the end of the last marked phase
+        self.phases:List[Tuple[str, float]] = [] # (name, duration in seconds)
+
+    def enable(self, start:float=None) -> None:
+        '''
+        Start recording
+
+        Parameters:
+            start: the time.perf_counter() at which the startup began. By default now
+        '''
+        self.enabled = True
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, name:str) -> None:
+        '''
+        Mark the end of a phase which started at the end of the previous phase
+        '''
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def get_total(self) -> float:
+        '''
+        Get the time from the start until the end of the last phase in seconds
+        '''
+        return self.last - self.start
+
+    def report(self, budget_ms:float=None) -> str:
+        '''
+        Get a table with the duration of every phase
+
+        Parameters:
+            budget_ms: the allowed total startup time. If it is exceeded the report says so
+        '''
+        width = max([len(name) for name, _ in self.phases] + [len('total')])
+        lines = ['Startup profile:']
+        for name, duration in self.phases:
+            lines.append(f'  {name:<{width}} {duration * 1000:8.1f} ms')
+        total_ms = self.get_total() * 1000
+        lines.append(f'  {"total":<{width}} {total_ms:8.1f} ms')
+        if budget_ms is not None and total_ms > budget_ms:
+            lines.append(f'  over the budget of {budget_ms:.0f} ms by {total_ms - budget_ms:.1f} ms')
+        return '\n'.join(lines)
+
+# The profile of the running application
+startup_profile = StartupProfile()